@@ -1,30 +1,189 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import hashlib
+import importlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import secrets
 import sqlite3
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import partial, reduce
+from itertools import islice, repeat
+from operator import and_, itemgetter
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from openpyxl import Workbook, load_workbook
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# ============================================================
+# INSTRUMENTATION (opt-in: DASHBOARD_PROFILE=1)
+# ============================================================
+
+PROFILE_ENABLED = os.environ.get("DASHBOARD_PROFILE", "") not in ("", "0")
+PROFILE_LOG = os.environ.get("DASHBOARD_PROFILE_LOG", "perf_log.jsonl")
+
+RUN_STARTED = time.perf_counter()
+
+
+def perf_stages():
+    # The stage list lives in session_state, reset by main() on every rerun:
+    # cached storage and loaders keep the module of the run that created them,
+    # so a module global would collect their stages into a list nobody shows.
+    # Cached loaders only add their stages on a cache miss
+    return st.session_state.setdefault("perf_stages", [])
+
+
+def perf_record(name, started, frame=None):
+    # Work outside a script run (the ingest worker, the command-line tools)
+    # belongs to no rerun's log
+    if not PROFILE_ENABLED or get_script_run_ctx() is None:
+        return
+    entry = {"stage": name, "ms": round((time.perf_counter() - started) * 1000, 3)}
+    if frame is not None:
+        entry["rows"] = len(frame)
+        entry["bytes"] = frame_memory(frame)
+    perf_stages().append(entry)
+
+
+def write_perf_log(record):
+    # Append-only JSON lines, one per rerun
+    with open(PROFILE_LOG, "a", encoding="utf-8") as log:
+        log.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def render_perf_panel(context):
+    if not PROFILE_ENABLED:
+        return
+    total_ms = round((time.perf_counter() - RUN_STARTED) * 1000, 3)
+    write_perf_log({"ts": datetime.now().isoformat(timespec="seconds"), **context, "total_ms": total_ms, "stages": perf_stages()})
+
+    with st.expander("⏱️ Performance"):
+        st.caption(f"Rerun completo: {total_ms:,.1f} ms · registro en {PROFILE_LOG}")
+        stages = pd.DataFrame(perf_stages(), columns=["stage", "ms", "rows", "bytes"])
+        stages["bytes"] = stages["bytes"].map(lambda n: "" if pd.isna(n) else format_bytes(n))
+        st.dataframe(
+            stages.rename(columns={"stage": "Etapa", "ms": "ms", "rows": "Filas", "bytes": "Memoria"}),
+            hide_index=True,
+        )
+
+# ============================================================
+# CONNECTION POOL
+# ============================================================
+
+DB_PATH = "data.db"
+POOL_SIZE = 8
+
+# WAL lets dashboard reads proceed while an upload holds the write lock
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA busy_timeout = 30000",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA mmap_size = 268435456",
+]
+
+
+def open_connection():
+    conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+@st.cache_resource
+def connection_pool():
+    # One pool per process, shared by every session and rerun
+    return queue.LifoQueue(maxsize=POOL_SIZE)
+
+
+def get_connection():
+    try:
+        return connection_pool().get_nowait()
+    except queue.Empty:
+        return open_connection()
+
+
+def release_connection(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        connection_pool().put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
 
 # ============================================================
 # DATABASE SETUP
 # ============================================================
 
+# Rows failing the saldo checks, keyed like fact_capital and refreshed for the
+# series each upload or delete touches; rows skipped at ingest are one
+# 'incompleta' row per upload (keys 0, actual = rows skipped)
+INGEST_ISSUES_TABLE = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        centro_id INTEGER NOT NULL,
+        concepto_id INTEGER NOT NULL,
+        fecha INTEGER NOT NULL,
+        check_name TEXT NOT NULL,
+        expected REAL,
+        actual REAL,
+        upload_id INTEGER,
+        PRIMARY KEY (centro_id, concepto_id, fecha, check_name, upload_id)
+    )
+"""
+
+
 def init_db():
-    conn = sqlite3.connect("data.db")
+    conn = get_connection()
     cur = conn.cursor()
 
+    fresh = cur.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'fact_capital'"
+    ).fetchone()[0] == 0
+
     cur.execute("""
         CREATE TABLE IF NOT EXISTS uploads (
             upload_id INTEGER PRIMARY KEY AUTOINCREMENT,
             filename TEXT,
-            timestamp TEXT
+            timestamp TEXT,
+            content_hash TEXT
         )
     """)
 
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS dim_centro (
+            centro_id INTEGER PRIMARY KEY,
+            centro TEXT NOT NULL UNIQUE
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS dim_concepto (
+            concepto_id INTEGER PRIMARY KEY,
+            concepto TEXT NOT NULL UNIQUE
+        )
+    """)
+
+    # fecha is a YYYYMM month key
     cur.execute("""
         CREATE TABLE IF NOT EXISTS fact_capital (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            fecha TEXT,
-            centro TEXT,
-            concepto TEXT,
+            fecha INTEGER,
+            centro_id INTEGER REFERENCES dim_centro (centro_id),
+            concepto_id INTEGER REFERENCES dim_concepto (concepto_id),
             inicial REAL,
             aportacion REAL,
             retiro REAL,
@@ -34,81 +193,1992 @@ def init_db():
         )
     """)
 
+    # Values an upsert replaced, with the upload that replaced them; deleting
+    # that upload puts them back, so every upload keeps the rows it loaded
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS fact_superseded (
+            fecha INTEGER NOT NULL,
+            centro_id INTEGER NOT NULL,
+            concepto_id INTEGER NOT NULL,
+            inicial REAL,
+            aportacion REAL,
+            retiro REAL,
+            rendimiento REAL,
+            saldo REAL,
+            upload_id INTEGER,
+            superseded_by INTEGER NOT NULL
+        )
+    """)
+
+    # Monthly sums per centro, kept in step with fact_capital by save/delete_upload
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_centro_month (
+            centro_id INTEGER NOT NULL,
+            fecha INTEGER NOT NULL,
+            inicial REAL,
+            aportacion REAL,
+            retiro REAL,
+            rendimiento REAL,
+            saldo REAL,
+            PRIMARY KEY (centro_id, fecha)
+        )
+    """)
+
+    # Sidebar metadata per centro/concepto, refreshed for the series an upload touches
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS filter_index (
+            centro_id INTEGER NOT NULL,
+            concepto_id INTEGER NOT NULL,
+            min_fecha INTEGER,
+            max_fecha INTEGER,
+            rows INTEGER,
+            PRIMARY KEY (centro_id, concepto_id)
+        )
+    """)
+
+    cur.execute(INGEST_ISSUES_TABLE.format(name="ingest_issues"))
+
+    # Background ingest jobs; live progress is kept in memory while running
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT,
+            status TEXT,
+            rows INTEGER,
+            upload_id INTEGER,
+            error TEXT,
+            created TEXT,
+            started TEXT,
+            finished TEXT,
+            seconds REAL,
+            owner TEXT
+        )
+    """)
+
+    # data_version is bumped by every write so cached reads know when to reload
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER
+        )
+    """)
+    # Seeded only when missing: on an up-to-date database init_db only reads,
+    # so it never waits on (or holds) the write lock
+    seeded = {key for (key,) in cur.execute("SELECT key FROM meta")}
+    # database_id tells this file's Parquet partitions apart from any other's
+    defaults = [("data_version", 0), ("parquet_version", -1), ("database_id", secrets.randbits(62))]
+    for key, value in defaults:
+        if key not in seeded:
+            cur.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # A new database already has the current schema; older files are upgraded
+    if fresh:
+        cur.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+    migrated = run_migrations(cur)
+    if migrated:
+        bump_data_version(cur)
+
+    create_indexes(cur)
+
     conn.commit()
-    conn.close()
+    if migrated:
+        conn.execute("VACUUM")
+    release_connection(conn)
+
+
+@st.cache_resource
+def ensure_db(path):
+    # Schema setup once per process and database file, not on every rerun
+    init_db()
+
+
+def create_indexes(cur):
+    # delete_upload filters by upload_id; the sidebar by centro -> concepto -> fecha,
+    # which is also the natural key a re-uploaded month upserts on
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_fact_upload ON fact_capital (upload_id)")
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_fact_natural_key
+        ON fact_capital (centro_id, concepto_id, fecha)
+    """)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_uploads_hash ON uploads (content_hash)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_superseded_upload ON fact_superseded (upload_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_superseded_by ON fact_superseded (superseded_by)")
+
+
+# ============================================================
+# SCHEMA MIGRATIONS (tracked in PRAGMA user_version)
+# ============================================================
+
+def migrate_fact_indexes(cur):
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_fact_upload ON fact_capital (upload_id)")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_fact_centro_concepto_fecha
+        ON fact_capital (centro, concepto, fecha)
+    """)
+    cur.execute("ANALYZE")
+
+
+def migrate_star_schema(cur):
+    # TEXT fecha/centro/concepto -> YYYYMM month key + dimension ids
+    cur.execute("INSERT OR IGNORE INTO dim_centro (centro) SELECT DISTINCT centro FROM fact_capital WHERE centro IS NOT NULL")
+    cur.execute("INSERT OR IGNORE INTO dim_concepto (concepto) SELECT DISTINCT concepto FROM fact_capital WHERE concepto IS NOT NULL")
+
+    cur.execute("""
+        CREATE TABLE fact_capital_v2 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fecha INTEGER,
+            centro_id INTEGER REFERENCES dim_centro (centro_id),
+            concepto_id INTEGER REFERENCES dim_concepto (concepto_id),
+            inicial REAL,
+            aportacion REAL,
+            retiro REAL,
+            rendimiento REAL,
+            saldo REAL,
+            upload_id INTEGER
+        )
+    """)
+    cur.execute("""
+        INSERT INTO fact_capital_v2
+        (id, fecha, centro_id, concepto_id, inicial, aportacion, retiro, rendimiento, saldo, upload_id)
+        SELECT f.id,
+               CAST(substr(f.fecha, 1, 4) || substr(f.fecha, 6, 2) AS INTEGER),
+               c.centro_id, k.concepto_id,
+               f.inicial, f.aportacion, f.retiro, f.rendimiento, f.saldo, f.upload_id
+        FROM fact_capital f
+        LEFT JOIN dim_centro c ON c.centro = f.centro
+        LEFT JOIN dim_concepto k ON k.concepto = f.concepto
+    """)
+    cur.execute("DROP TABLE fact_capital")
+    cur.execute("ALTER TABLE fact_capital_v2 RENAME TO fact_capital")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_fact_upload ON fact_capital (upload_id)")
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_fact_centro_concepto_fecha
+        ON fact_capital (centro_id, concepto_id, fecha)
+    """)
+    cur.execute("ANALYZE")
+
+
+def migrate_rollup(cur):
+    rebuild_rollup(cur)
 
-init_db()
+
+def migrate_dedup(cur):
+    cur.execute("ALTER TABLE uploads ADD COLUMN content_hash TEXT")
+
+    # Repeated uploads left duplicate rows; keep the most recently inserted one.
+    # Rows missing part of the key are not duplicates of each other: they stay
+    # for migrate_incomplete_rows to count
+    cur.execute(f"""
+        DELETE FROM fact_capital WHERE NOT ({INCOMPLETE_FACT}) AND id NOT IN (
+            SELECT MAX(id) FROM fact_capital GROUP BY centro_id, concepto_id, fecha
+        )
+    """)
+    cur.execute("DROP INDEX IF EXISTS idx_fact_centro_concepto_fecha")
+    create_indexes(cur)
+    rebuild_rollup(cur)
+
+
+def migrate_filter_index(cur):
+    rebuild_filter_index(cur)
+
+
+def migrate_ingest_issues(cur):
+    rebuild_ingest_issues(cur)
+
+
+def migrate_incomplete_rows(cur):
+    # upload_id joins the ingest_issues key, and fact rows stored without
+    # fecha/centro/concepto by earlier versions become per-upload counts
+    cur.execute(INGEST_ISSUES_TABLE.format(name="ingest_issues_v2"))
+    cur.execute("INSERT OR IGNORE INTO ingest_issues_v2 SELECT * FROM ingest_issues")
+    cur.execute("DROP TABLE ingest_issues")
+    cur.execute("ALTER TABLE ingest_issues_v2 RENAME TO ingest_issues")
+
+    cur.execute(f"""
+        INSERT INTO ingest_issues (centro_id, concepto_id, fecha, check_name, expected, actual, upload_id)
+        SELECT 0, 0, 0, '{INCOMPLETE_CHECK}', NULL, COUNT(*), upload_id
+        FROM fact_capital WHERE {INCOMPLETE_FACT}
+        GROUP BY upload_id
+    """)
+    cur.execute(f"DELETE FROM fact_capital WHERE {INCOMPLETE_FACT}")
+
+
+def migrate_job_owner(cur):
+    # Which process runs each job ("app:<pid>", "ingest:<pid>"), so the app only
+    # writes off its own jobs at startup. ingest_jobs may have just been
+    # created with the column by init_db
+    columns = {row[1] for row in cur.execute("PRAGMA table_info(ingest_jobs)")}
+    if "owner" not in columns:
+        cur.execute("ALTER TABLE ingest_jobs ADD COLUMN owner TEXT")
+
+
+MIGRATIONS = [
+    migrate_fact_indexes,
+    migrate_star_schema,
+    migrate_rollup,
+    migrate_dedup,
+    migrate_filter_index,
+    migrate_ingest_issues,
+    migrate_incomplete_rows,
+    migrate_job_owner,
+]
+
+
+def run_migrations(cur):
+    current = cur.execute("PRAGMA user_version").fetchone()[0]
+    for version, migration in enumerate(MIGRATIONS[current:], start=current + 1):
+        migration(cur)
+        cur.execute(f"PRAGMA user_version = {version}")
+    return current < len(MIGRATIONS)
+
+
+def bump_data_version(cur):
+    cur.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_version'")
+
+
+def get_data_version():
+    conn = get_connection()
+    version = conn.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()[0]
+    release_connection(conn)
+    return version
 
 # ============================================================
 # SAVE UPLOADED FILE
 # ============================================================
 
-def save_upload(file):
-    conn = sqlite3.connect("data.db")
+# Excel header -> fact_capital column, in insert order
+FACT_COLUMNS = {
+    "Fecha": "fecha",
+    "Centro": "centro",
+    "Concepto": "concepto",
+    "Inicial": "inicial",
+    "Aportación": "aportacion",
+    "Retiro": "retiro",
+    "Rendimiento": "rendimiento",
+    "Saldo": "saldo",
+}
+
+INSERT_CHUNK_SIZE = 10_000
+
+# Uploads above this size are parsed row by row instead of via pd.read_excel
+STREAMING_THRESHOLD_BYTES = 5 * 1024 * 1024
+
+# Processes parsing sheets when an upload has more than one sheet or file
+PARSE_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def month_key(value):
+    if not isinstance(value, datetime):
+        value = pd.Timestamp(value)
+    return value.year * 100 + value.month
+
+
+def cell_month_key(value):
+    # Blank or unreadable dates give None, so only that row is skipped
+    if isinstance(value, datetime):
+        return value.year * 100 + value.month
+    value = pd.to_datetime(value, errors="coerce")
+    return None if pd.isna(value) else value.year * 100 + value.month
+
+
+def month_key_to_datetime(keys):
+    started = time.perf_counter()
+    fechas = pd.to_datetime(pd.DataFrame({"year": keys // 100, "month": keys % 100, "day": 1}))
+    perf_record("parse fechas", started, fechas)
+    return fechas
+
+
+def frame_to_columns(df):
+    # Convert each column once instead of boxing values row by row
+    fecha = pd.to_datetime(df["Fecha"], errors="coerce")
+    columns = [(fecha.dt.year * 100 + fecha.dt.month).tolist()]
+    for excel_col in list(FACT_COLUMNS)[1:]:
+        columns.append(df[excel_col].tolist())
+    return columns
+
+
+# Parsed rows wait in a per-connection TEMP table. Writing there doesn't take
+# the main database's write lock, so however long parsing takes, other
+# sessions keep writing; the lock is held only while staged rows are applied
+STAGING_COLUMNS = ["fecha", "centro", "concepto", "inicial", "aportacion", "retiro", "rendimiento", "saldo"]
+
+STAGED_COMPLETE = "s.fecha IS NOT NULL AND s.centro IS NOT NULL AND s.concepto IS NOT NULL"
+
+STAGED_FACT_INSERT = f"""
+    INSERT INTO fact_capital
+    (fecha, centro_id, concepto_id, inicial, aportacion, retiro, rendimiento, saldo, upload_id)
+    SELECT s.fecha, c.centro_id, k.concepto_id,
+           s.inicial, s.aportacion, s.retiro, s.rendimiento, s.saldo, ?
+    FROM staging_fact s
+    LEFT JOIN dim_centro c ON c.centro = s.centro
+    LEFT JOIN dim_concepto k ON k.concepto = s.concepto
+    WHERE s.item = ? AND {STAGED_COMPLETE}
+    ORDER BY s.rowid
+    ON CONFLICT (centro_id, concepto_id, fecha) DO UPDATE SET
+        inicial = excluded.inicial,
+        aportacion = excluded.aportacion,
+        retiro = excluded.retiro,
+        rendimiento = excluded.rendimiento,
+        saldo = excluded.saldo,
+        upload_id = excluded.upload_id
+"""
+
+
+# Rows another upload loaded for the staged keys are kept before the upsert
+# overwrites them; repeats within the same upload just take the later value
+STAGED_SUPERSEDE = f"""
+    INSERT INTO fact_superseded
+    (fecha, centro_id, concepto_id, inicial, aportacion, retiro, rendimiento, saldo, upload_id, superseded_by)
+    SELECT f.fecha, f.centro_id, f.concepto_id,
+           f.inicial, f.aportacion, f.retiro, f.rendimiento, f.saldo, f.upload_id, :upload_id
+    FROM (
+        SELECT DISTINCT s.fecha, c.centro_id, k.concepto_id
+        FROM staging_fact s
+        JOIN dim_centro c ON c.centro = s.centro
+        JOIN dim_concepto k ON k.concepto = s.concepto
+        WHERE s.item = :item AND {STAGED_COMPLETE}
+    ) s
+    JOIN fact_capital f ON f.centro_id = s.centro_id AND f.concepto_id = s.concepto_id AND f.fecha = s.fecha
+    WHERE f.upload_id IS NOT :upload_id
+"""
+
+
+def open_staging_connection():
+    # Its own connection so the staged rows spill to a temp file rather than
+    # the pool's in-memory temp store, and vanish when it closes
+    conn = open_connection()
+    conn.execute("PRAGMA temp_store = FILE")
+    conn.execute(f"""
+        CREATE TEMP TABLE staging_fact (
+            item INTEGER,
+            {", ".join(STAGING_COLUMNS)}
+        )
+    """)
+    return conn
+
+
+def stage_rows(cur, item, columns, chunk_size=INSERT_CHUNK_SIZE):
+    rows = zip(repeat(item), *columns)
+    placeholders = ", ".join("?" * (len(STAGING_COLUMNS) + 1))
+    staged = 0
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        cur.executemany(f"INSERT INTO staging_fact VALUES ({placeholders})", chunk)
+        staged += len(chunk)
+    return staged
+
+
+def apply_staging(cur, upload_id, item):
+    # Rows without fecha, centro or concepto (a "TOTAL" footer, a blank or
+    # unreadable date) can't be keyed: they are only counted in ingest_issues
+    skipped = cur.execute(
+        f"SELECT COUNT(*) FROM staging_fact s WHERE item = ? AND NOT ({STAGED_COMPLETE})", (item,)
+    ).fetchone()[0]
+    if skipped:
+        cur.execute(f"""
+            INSERT INTO ingest_issues (centro_id, concepto_id, fecha, check_name, expected, actual, upload_id)
+            VALUES (0, 0, 0, '{INCOMPLETE_CHECK}', NULL, ?, ?)
+        """, (skipped, upload_id))
+
+    # Dimension names first, then every staged row in file order, so a month
+    # repeated later in the batch still wins the upsert
+    for table, col in [("dim_centro", "centro"), ("dim_concepto", "concepto")]:
+        cur.execute(f"""
+            INSERT OR IGNORE INTO {table} ({col})
+            SELECT DISTINCT {col} FROM staging_fact s WHERE item = ? AND {STAGED_COMPLETE}
+        """, (item,))
+    cur.execute(STAGED_SUPERSEDE, {"upload_id": upload_id, "item": item})
+    cur.execute(STAGED_FACT_INSERT, (upload_id, item))
+    return skipped
+
+
+def iter_excel_chunks(ws, chunk_size=INSERT_CHUNK_SIZE):
+    # Read-only openpyxl rows, so only one chunk is ever held in memory
+    rows = ws.iter_rows(values_only=True)
+    header = list(next(rows, ()))
+
+    positions = []
+    for excel_col in FACT_COLUMNS:
+        if excel_col not in header:
+            raise KeyError(excel_col)
+        positions.append(header.index(excel_col))
+    pick = itemgetter(*positions)
+
+    records = (pick(row) for row in rows if any(v is not None for v in row))
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
+        columns = [list(col) for col in zip(*chunk)]
+        columns[0] = [cell_month_key(v) for v in columns[0]]
+        yield columns
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(1 << 20), b""):
+        digest.update(block)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def open_upload(file, streaming=False, sheet_name=None):
+    # Returns (column chunks, expected row count, workbook to close or None)
+    if streaming:
+        wb = load_workbook(file, read_only=True, data_only=True)
+        ws = wb[sheet_name] if sheet_name is not None else wb.active
+        total = ws.max_row - 1 if ws.max_row else None
+        return iter_excel_chunks(ws), total, wb
+
+    df = pd.read_excel(file, sheet_name=sheet_name or 0)
+    return map(frame_to_columns, [df]), len(df), None
+
+
+def workbook_sheets(file):
+    # Names and row estimates (from the read-only dimensions) of the sheets
+    # whose header has every fact column; empty Hoja2/Hoja3, summaries and
+    # notes are dropped. A workbook with none keeps its active sheet so the
+    # parser still reports the missing column
+    file.seek(0)
+    wb = load_workbook(file, read_only=True, data_only=True)
+    sheets = []
+    for ws in wb.worksheets:
+        header = next(ws.iter_rows(max_row=1, values_only=True), ())
+        if all(col in header for col in FACT_COLUMNS):
+            sheets.append((ws.title, (ws.max_row or 1) - 1))
+    if not sheets:
+        sheets = [(wb.active.title, (wb.active.max_row or 1) - 1)]
+    wb.close()
+    file.seek(0)
+    return sheets
+
+
+def parse_sheet(data, sheet_name):
+    # Runs in a parse pool process on the raw workbook bytes; read-only mode
+    # only inflates the one sheet being parsed
+    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        return list(iter_excel_chunks(wb[sheet_name]))
+    finally:
+        wb.close()
+
+
+@st.cache_resource
+def parse_pool():
+    # Never fork: the Streamlit server is multi-threaded, and a forked child
+    # can deadlock on a lock another thread held. Workers start clean and
+    # import parse_sheet by module name (see pooled_sheet_parser)
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context(method))
+
+
+def pooled_sheet_parser():
+    # Pool processes look functions up by module name, and Streamlit runs this
+    # file as __main__; the copy imported under its own name (data layer only,
+    # the UI sits behind main()) is one they can find
+    return importlib.import_module(os.path.splitext(os.path.basename(__file__))[0]).parse_sheet
+
+
+def pooled_chunks(file, sheet_names):
+    # Submits every sheet now so parsing runs while earlier files are written;
+    # a sheet without the fact columns is skipped unless none of them has them
+    file.seek(0)
+    data = file.read()
+    parse = pooled_sheet_parser()
+    futures = deque(parse_pool().submit(parse, data, name) for name in sheet_names)
+
+    def chunks():
+        missing = None
+        parsed = False
+        while futures:
+            try:
+                sheet = futures.popleft().result()
+            except KeyError as exc:
+                missing = missing or exc
+                continue
+            parsed = True
+            yield from sheet
+        if not parsed and missing:
+            raise missing
+
+    return chunks()
+
+
+def ingest_stats(upload_id, rows, elapsed, duplicate=False):
+    return {
+        "upload_id": upload_id,
+        "rows": rows,
+        "seconds": elapsed,
+        "rows_per_sec": rows / elapsed if elapsed > 0 else float("inf"),
+        "duplicate": duplicate,
+    }
+
+
+def find_upload(file_hash):
+    conn = get_connection()
+    existing = conn.execute(
+        "SELECT upload_id FROM uploads WHERE content_hash = ?", (file_hash,)
+    ).fetchone()
+    release_connection(conn)
+    return existing[0] if existing else None
+
+
+def plan_uploads(files, streaming=False, find=find_upload):
+    # Dedup by content hash, then pick how to parse: a single data sheet keeps
+    # the in-process reader (bounded memory when streaming); several data
+    # sheets or files are parsed concurrently in the process pool, which
+    # materializes each sheet. Only sheets with the fact header are counted.
+    # Returns ({position: duplicate stats}, [(position, filename, hash, chunks, total)], workbooks)
+    duplicates, pending = {}, []
+    seen = set()
+    for position, file in enumerate(files):
+        file_hash = content_hash(file)
+        existing = find(file_hash)
+        if existing or file_hash in seen:
+            duplicates[position] = ingest_stats(existing, 0, 0.0, duplicate=True)
+            continue
+        seen.add(file_hash)
+        pending.append((position, file, file_hash, workbook_sheets(file)))
+
+    items, workbooks = [], []
+    pooled = sum(len(sheets) for *_, sheets in pending) > 1
+    for position, file, file_hash, sheets in pending:
+        if pooled:
+            chunks = pooled_chunks(file, [name for name, _ in sheets])
+            total = sum(rows for _, rows in sheets)
+        else:
+            chunks, total, wb = open_upload(file, streaming, sheets[0][0])
+            if wb is not None:
+                workbooks.append(wb)
+        items.append((position, file.name, file_hash, chunks, total))
+    return duplicates, items, workbooks
+
+
+def save_uploads(files, streaming=False, progress=None):
+    # Every new workbook gets its own uploads row (so it can be deleted on
+    # its own) but they are all written in a single transaction
+    duplicates, items, workbooks = plan_uploads(files, streaming)
+    try:
+        stats = ingest_uploads([item[1:] for item in items], progress) if items else []
+    finally:
+        for wb in workbooks:
+            wb.close()
+
+    results = dict(duplicates)
+    results.update(zip([item[0] for item in items], stats))
+    return [results[i] for i in range(len(files))]
+
+
+def save_upload(file, streaming=False, progress=None):
+    return save_uploads([file], streaming, progress)[0]
+
+
+def ingest_chunks(filename, file_hash, chunks, total=None, progress=None):
+    return ingest_uploads([(filename, file_hash, chunks, total)], progress)[0]
+
+
+def ingest_uploads(items, progress=None):
+    # items: (filename, hash, chunks, total) where chunks yields
+    # [fecha keys, centros, conceptos, inicial, ..., saldo] column lists
+    conn = open_staging_connection()
     cur = conn.cursor()
+    try:
+        start = time.perf_counter()
+        timestamp = datetime.now().isoformat()
+        grand_total = None if any(item[3] is None for item in items) else sum(item[3] for item in items)
+
+        # Parse and stage every file without touching the main database
+        staged = []
+        rows = 0
+        for item, (_, _, chunks, _) in enumerate(items):
+            item_rows = 0
+            for columns in chunks:
+                item_rows += stage_rows(cur, item, columns)
+                conn.commit()
+                if progress:
+                    progress(rows + item_rows, grand_total)
+            rows += item_rows
+            staged.append(item_rows)
+
+        # Upload rows and all fact rows share one short write transaction
+        cur.execute("BEGIN IMMEDIATE")
+        uploaded = []
+        for item, (filename, file_hash, _, _) in enumerate(items):
+            cur.execute(
+                "INSERT INTO uploads (filename, timestamp, content_hash) VALUES (?, ?, ?)",
+                (filename, timestamp, file_hash),
+            )
+            upload_id = cur.lastrowid
+            skipped = apply_staging(cur, upload_id, item)
+            uploaded.append((upload_id, staged[item] - skipped))
+
+        # Upserted rows may have replaced other uploads' values in the same months
+        upload_ids = [upload_id for upload_id, _ in uploaded]
+        mark_rollup_groups(cur, *upload_ids)
+        rebuild_rollup_groups(cur)
+        mark_filter_index(cur, *upload_ids)
+        refresh_filter_index(cur)
+        refresh_ingest_issues(cur)
+        bump_data_version(cur)
+        conn.commit()
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - start
+    try_sync_parquet_cache()
+    return [ingest_stats(upload_id, n, elapsed) for upload_id, n in uploaded]
 
-    timestamp = datetime.now().isoformat()
-    cur.execute("INSERT INTO uploads (filename, timestamp) VALUES (?, ?)", (file.name, timestamp))
-    upload_id = cur.lastrowid
 
-    df = pd.read_excel(file)
+# ============================================================
+# MONTHLY ROLLUP (centro x month)
+# ============================================================
+
+ROLLUP_SELECT = """
+    SELECT centro_id, fecha,
+           TOTAL(inicial), TOTAL(aportacion), TOTAL(retiro), TOTAL(rendimiento), TOTAL(saldo)
+    FROM fact_capital
+"""
+
+ROLLUP_INSERT = """
+    INSERT INTO rollup_centro_month
+    (centro_id, fecha, inicial, aportacion, retiro, rendimiento, saldo)
+"""
+
+
+def rebuild_rollup(cur):
+    cur.execute("DELETE FROM rollup_centro_month")
+    cur.execute(
+        ROLLUP_INSERT + ROLLUP_SELECT
+        + " WHERE centro_id IS NOT NULL AND fecha IS NOT NULL GROUP BY centro_id, fecha"
+    )
+
+
+def mark_rollup_groups(cur, *upload_ids):
+    # Remember which (centro, month) groups the uploads touch before their rows go
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS touched_groups (centro_id INTEGER, fecha INTEGER)")
+    cur.execute("DELETE FROM touched_groups")
+    cur.execute(f"""
+        INSERT INTO touched_groups
+        SELECT DISTINCT centro_id, fecha FROM fact_capital
+        WHERE upload_id IN ({", ".join("?" * len(upload_ids))})
+          AND centro_id IS NOT NULL AND fecha IS NOT NULL
+    """, upload_ids)
+
+
+def rebuild_rollup_groups(cur):
+    # Recompute touched groups from the remaining rows instead of subtracting,
+    # so repeated add/delete cycles don't accumulate float error
+    cur.execute("""
+        DELETE FROM rollup_centro_month
+        WHERE (centro_id, fecha) IN (SELECT centro_id, fecha FROM touched_groups)
+    """)
+    cur.execute(
+        ROLLUP_INSERT + ROLLUP_SELECT + """
+        WHERE (centro_id, fecha) IN (SELECT centro_id, fecha FROM touched_groups)
+        GROUP BY centro_id, fecha
+    """)
+
+
+# ============================================================
+# FILTER INDEX (centro -> concepto -> date bounds)
+# ============================================================
+
+FILTER_INDEX_INSERT = """
+    INSERT INTO filter_index (centro_id, concepto_id, min_fecha, max_fecha, rows)
+    SELECT centro_id, concepto_id, MIN(fecha), MAX(fecha), COUNT(*)
+    FROM fact_capital
+"""
+
+
+def rebuild_filter_index(cur):
+    cur.execute("DELETE FROM filter_index")
+    cur.execute(
+        FILTER_INDEX_INSERT
+        + " WHERE centro_id IS NOT NULL AND concepto_id IS NOT NULL GROUP BY centro_id, concepto_id"
+    )
+
+
+def mark_filter_index(cur, *upload_ids):
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS touched_series (centro_id INTEGER, concepto_id INTEGER)")
+    cur.execute("DELETE FROM touched_series")
+    cur.execute(f"""
+        INSERT INTO touched_series
+        SELECT DISTINCT centro_id, concepto_id FROM fact_capital
+        WHERE upload_id IN ({", ".join("?" * len(upload_ids))})
+          AND centro_id IS NOT NULL AND concepto_id IS NOT NULL
+    """, upload_ids)
 
-    for _, row in df.iterrows():
-        cur.execute("""
-            INSERT INTO fact_capital 
-            (fecha, centro, concepto, inicial, aportacion, retiro, rendimiento, saldo, upload_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            str(row["Fecha"]),
-            row["Centro"],
-            row["Concepto"],
-            row["Inicial"],
-            row["Aportación"],
-            row["Retiro"],
-            row["Rendimiento"],
-            row["Saldo"],
-            upload_id
-        ))
 
+def refresh_filter_index(cur):
+    cur.execute("""
+        DELETE FROM filter_index
+        WHERE (centro_id, concepto_id) IN (SELECT centro_id, concepto_id FROM touched_series)
+    """)
+    cur.execute(
+        FILTER_INDEX_INSERT + """
+        WHERE (centro_id, concepto_id) IN (SELECT centro_id, concepto_id FROM touched_series)
+        GROUP BY centro_id, concepto_id
+    """)
+
+
+# ============================================================
+# RECONCILIATION (ingest_issues)
+# ============================================================
+
+# saldo = inicial + aportacion - retiro + rendimiento, and inicial = the
+# previous month's saldo for the same centro/concepto, to the cent
+RECONCILE_TOLERANCE = 0.01
+
+INCOMPLETE_CHECK = "incompleta"
+INCOMPLETE_FACT = "fecha IS NULL OR centro_id IS NULL OR concepto_id IS NULL"
+
+ISSUE_LABELS = {
+    "saldo": "Saldo ≠ inicial + aportación − retiro + rendimiento",
+    "continuidad": "Inicial ≠ saldo del mes anterior",
+    INCOMPLETE_CHECK: "Sin fecha, centro o concepto (omitidas al cargar)",
+}
+
+# Only these are recomputed from the facts; skipped-row counts aren't
+DERIVED_CHECKS = "check_name IN ('saldo', 'continuidad')"
+
+# {series} narrows both checks to some centro/concepto pairs; continuity
+# only compares consecutive months, a gap in a series isn't an issue
+ISSUES_INSERT = """
+    INSERT INTO ingest_issues (centro_id, concepto_id, fecha, check_name, expected, actual, upload_id)
+    SELECT centro_id, concepto_id, fecha, 'saldo',
+           COALESCE(inicial, 0) + COALESCE(aportacion, 0) - COALESCE(retiro, 0) + COALESCE(rendimiento, 0),
+           saldo, upload_id
+    FROM fact_capital
+    WHERE centro_id IS NOT NULL AND concepto_id IS NOT NULL AND fecha IS NOT NULL {series}
+      AND ABS(saldo - (COALESCE(inicial, 0) + COALESCE(aportacion, 0)
+                       - COALESCE(retiro, 0) + COALESCE(rendimiento, 0))) > :tolerance
+    UNION ALL
+    SELECT centro_id, concepto_id, fecha, 'continuidad', prev_saldo, inicial, upload_id
+    FROM (
+        SELECT centro_id, concepto_id, fecha, inicial, upload_id,
+               LAG(saldo) OVER w AS prev_saldo,
+               LAG(fecha) OVER w AS prev_fecha
+        FROM fact_capital
+        WHERE centro_id IS NOT NULL AND concepto_id IS NOT NULL AND fecha IS NOT NULL {series}
+        WINDOW w AS (PARTITION BY centro_id, concepto_id ORDER BY fecha)
+    )
+    WHERE prev_fecha = CASE WHEN fecha % 100 = 1 THEN fecha - 89 ELSE fecha - 1 END
+      AND ABS(inicial - prev_saldo) > :tolerance
+"""
+
+TOUCHED_SERIES = "AND (centro_id, concepto_id) IN (SELECT centro_id, concepto_id FROM touched_series)"
+
+
+def rebuild_ingest_issues(cur):
+    cur.execute(f"DELETE FROM ingest_issues WHERE {DERIVED_CHECKS}")
+    cur.execute(ISSUES_INSERT.format(series=""), {"tolerance": RECONCILE_TOLERANCE})
+
+
+def refresh_ingest_issues(cur):
+    # Whole touched series, not just the new rows: an upserted month can fix
+    # or break the continuity of the month after it
+    cur.execute(f"""
+        DELETE FROM ingest_issues WHERE {DERIVED_CHECKS}
+        AND (centro_id, concepto_id) IN (SELECT centro_id, concepto_id FROM touched_series)
+    """)
+    cur.execute(ISSUES_INSERT.format(series=TOUCHED_SERIES), {"tolerance": RECONCILE_TOLERANCE})
+
+
+# ============================================================
+# PARQUET CACHE (one partition file per upload)
+# ============================================================
+
+def parquet_dir_for(db_path):
+    # One cache per database file (data.db -> data.parquet_cache), so databases
+    # sharing a folder never remove or overwrite each other's partitions
+    return os.path.splitext(db_path)[0] + ".parquet_cache"
+
+
+PARQUET_DIR = parquet_dir_for(DB_PATH)
+# Written by a finished sync; the reader only trusts partitions it describes
+PARQUET_MANIFEST = "_manifest.json"
+
+PARTITION_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("fecha", pa.int64()),
+    ("centro", pa.string()),
+    ("concepto", pa.string()),
+    ("inicial", pa.float64()),
+    ("aportacion", pa.float64()),
+    ("retiro", pa.float64()),
+    ("rendimiento", pa.float64()),
+    ("saldo", pa.float64()),
+    ("upload_id", pa.int64()),
+])
+
+
+def partition_path(upload_id):
+    return os.path.join(PARQUET_DIR, f"upload_{upload_id}.parquet")
+
+
+def database_stamp(database_id):
+    return {b"database_id": str(database_id).encode()}
+
+
+def partition_is_current(path, rows, database_id):
+    if not os.path.exists(path):
+        return False
+    metadata = pq.read_metadata(path)
+    stamp = (metadata.metadata or {}).get(b"database_id")
+    return metadata.num_rows == rows and stamp == database_stamp(database_id)[b"database_id"]
+
+
+def read_manifest():
+    try:
+        with open(os.path.join(PARQUET_DIR, PARQUET_MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(database_id, version):
+    tmp = os.path.join(PARQUET_DIR, f".manifest.{threading.get_ident()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump({"database_id": database_id, "data_version": version}, f)
+    os.replace(tmp, os.path.join(PARQUET_DIR, PARQUET_MANIFEST))
+
+
+def write_partition(conn, upload_id, database_id):
+    # Sorted so row-group statistics let centro/concepto/fecha filters skip data
+    df = pd.read_sql_query(
+        FACT_SELECT + " WHERE f.upload_id = ? ORDER BY c.centro, k.concepto, f.fecha",
+        conn, params=(upload_id,),
+    )
+    table = pa.Table.from_pandas(df, schema=PARTITION_SCHEMA, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), **database_stamp(database_id)})
+
+    # Dot-prefixed temp files are ignored by readers until the atomic rename
+    tmp = os.path.join(PARQUET_DIR, f".upload_{upload_id}.{threading.get_ident()}.tmp")
+    pq.write_table(table, tmp, row_group_size=64_000)
+    os.replace(tmp, partition_path(upload_id))
+
+
+def sync_parquet_cache():
+    # Partitions mirror the rows each upload currently owns; upserts can move
+    # rows to a newer upload, so any partition whose row count drifted is rewritten.
+    # A partition stamped by another database (a file recreated under the same
+    # name) is rewritten too
+    os.makedirs(PARQUET_DIR, exist_ok=True)
+    conn = get_connection()
+    meta = dict(conn.execute(
+        "SELECT key, value FROM meta WHERE key IN ('data_version', 'database_id')"
+    ).fetchall())
+    version, database_id = meta["data_version"], meta["database_id"]
+    counts = dict(conn.execute(
+        "SELECT upload_id, COUNT(*) FROM fact_capital GROUP BY upload_id"
+    ).fetchall())
+
+    for name in os.listdir(PARQUET_DIR):
+        if name.startswith("upload_") and name.endswith(".parquet"):
+            upload_id = int(name[len("upload_"):-len(".parquet")])
+            if upload_id not in counts:
+                os.remove(os.path.join(PARQUET_DIR, name))
+
+    for upload_id, rows in counts.items():
+        if not partition_is_current(partition_path(upload_id), rows, database_id):
+            write_partition(conn, upload_id, database_id)
+    write_manifest(database_id, version)
+
+    # Only mark the cache current if no write landed while we were syncing
+    conn.execute("""
+        UPDATE meta SET value = ? WHERE key = 'parquet_version'
+        AND (SELECT value FROM meta WHERE key = 'data_version') = ?
+    """, (version, version))
     conn.commit()
-    conn.close()
+    release_connection(conn)
+
+
+def try_sync_parquet_cache():
+    # The cache is derived and only used once marked current, so a failed
+    # sync just leaves reads on SQLite until the next write or worker start
+    # retries it; it must never fail a write that already committed
+    try:
+        sync_parquet_cache()
+    except (OSError, sqlite3.Error, pa.ArrowException):
+        return False
+    return True
+
+
+def parquet_cache_is_current(data_version=None):
+    conn = get_connection()
+    versions = dict(conn.execute(
+        "SELECT key, value FROM meta WHERE key IN ('data_version', 'parquet_version', 'database_id')"
+    ).fetchall())
+    release_connection(conn)
+
+    if data_version is None:
+        data_version = versions["data_version"]
+    if not versions["parquet_version"] == data_version == versions["data_version"]:
+        return False
+    manifest = read_manifest()
+    return (manifest.get("database_id") == versions["database_id"]
+            and manifest.get("data_version") == data_version)
+
+
+def parquet_filter(centro=None, concepto=None, start=None, end=None):
+    conditions = []
+    if centro is not None:
+        conditions.append(ds.field("centro") == centro)
+    if concepto is not None:
+        conditions.append(ds.field("concepto") == concepto)
+    if start is not None:
+        conditions.append(ds.field("fecha") >= start_month_key(start))
+    if end is not None:
+        conditions.append(ds.field("fecha") <= month_key(end))
+    return reduce(and_, conditions) if conditions else None
+
+
+def open_parquet_cache():
+    return ds.dataset(PARQUET_DIR, schema=PARTITION_SCHEMA, format="parquet")
+
+
+def read_parquet_cache(centro=None, concepto=None, start=None, end=None):
+    expression = parquet_filter(centro, concepto, start, end)
+    return open_parquet_cache().to_table(columns=FRAME_COLUMNS, filter=expression).to_pandas()
+
+
+def iter_parquet_chunks(chunk_rows, centro=None, concepto=None, start=None, end=None):
+    # Record batches in partition (upload) order, sorted within each upload
+    batches = open_parquet_cache().to_batches(
+        columns=FRAME_COLUMNS, filter=parquet_filter(centro, concepto, start, end), batch_size=chunk_rows,
+    )
+    for batch in batches:
+        if batch.num_rows:
+            df = batch.to_pandas()
+            df["fecha"] = month_key_to_datetime(df["fecha"])
+            yield df
 
 
 # ============================================================
-# LOAD ALL DATA
+# LOAD DATA (CACHED PER DATA VERSION, FILTERS PUSHED TO SQL)
 # ============================================================
 
-def load_data():
-    conn = sqlite3.connect("data.db")
-    df = pd.read_sql_query("SELECT * FROM fact_capital", conn)
-    conn.close()
+FACT_SELECT = """
+    SELECT f.id, f.fecha, c.centro, k.concepto,
+           f.inicial, f.aportacion, f.retiro, f.rendimiento, f.saldo, f.upload_id
+    FROM fact_capital f
+    LEFT JOIN dim_centro c ON c.centro_id = f.centro_id
+    LEFT JOIN dim_concepto k ON k.concepto_id = f.concepto_id
+"""
+
+# data_version is part of every cache key, so entries for old versions are
+# never hit again; bounded caches evict them instead of keeping every version.
+# Frames can be the whole table, so fewer of them are kept.
+CACHE_MAX_ENTRIES = 64
+FRAME_CACHE_ENTRIES = 8
+CACHE_TTL = 3600
+
+# Columns the dashboard actually uses; id/upload_id stay in the database
+FRAME_COLUMNS = ["fecha", "centro", "concepto", "inicial", "aportacion", "retiro", "rendimiento", "saldo"]
+
+FRAME_SELECT = """
+    SELECT f.fecha, c.centro, k.concepto,
+           f.inicial, f.aportacion, f.retiro, f.rendimiento, f.saldo
+    FROM fact_capital f
+    LEFT JOIN dim_centro c ON c.centro_id = f.centro_id
+    LEFT JOIN dim_concepto k ON k.concepto_id = f.concepto_id
+"""
+
+
+def compact_frame(df):
+    # Categoricals for the repeated names and datetime64 built from the int32
+    # month key. Money stays float64: float32 can't hold cents on balances
+    # in the tens of millions.
+    # Rows without a month (stored by versions that didn't skip them) can't
+    # be placed on any chart or KPI, so they're left out
+    df = df[FRAME_COLUMNS]
+    df = df[df["fecha"].notna()]
+    if df.empty:
+        return df
+
+    df = df.assign(
+        fecha=month_key_to_datetime(df["fecha"].astype("int32")),
+        centro=df["centro"].astype("category"),
+        concepto=df["concepto"].astype("category"),
+    )
+    return df
+
+
+def frame_memory(df):
+    # np.sum: a Series reports a single int, a DataFrame one per column
+    return int(np.sum(df.memory_usage(deep=True)))
+
+
+def format_bytes(n):
+    for unit in ["B", "KB", "MB"]:
+        if n < 1024:
+            return f"{n:,.0f} {unit}"
+        n /= 1024
+    return f"{n:,.1f} GB"
+
+
+def start_month_key(value):
+    # Rows are dated on the 1st, so a mid-month start excludes that month
+    ts = pd.Timestamp(value)
+    if ts != ts.normalize() or ts.day > 1:
+        ts += pd.offsets.MonthBegin(1)
+    return month_key(ts)
+
+
+def build_filters(centro=None, concepto=None, start=None, end=None, alias="f"):
+    clauses, params = [], []
+    if centro is not None:
+        clauses.append(f"{alias}.centro_id = (SELECT centro_id FROM dim_centro WHERE centro = ?)")
+        params.append(centro)
+    if concepto is not None:
+        clauses.append(f"{alias}.concepto_id = (SELECT concepto_id FROM dim_concepto WHERE concepto = ?)")
+        params.append(concepto)
+    if start is not None:
+        clauses.append(f"{alias}.fecha >= ?")
+        params.append(start_month_key(start))
+    if end is not None:
+        clauses.append(f"{alias}.fecha <= ?")
+        params.append(month_key(end))
+
+    where = " WHERE " + " AND ".join(clauses) if clauses else ""
+    return where, params
+
+
+# The sidebar reads filter_index only; no fact rows are touched
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def load_centros(data_version):
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT c.centro FROM dim_centro c
+        WHERE c.centro_id IN (SELECT centro_id FROM filter_index)
+        ORDER BY c.centro
+    """).fetchall()
+    release_connection(conn)
+    return [r[0] for r in rows]
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def load_conceptos(data_version, centro):
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT k.concepto FROM filter_index i
+        JOIN dim_concepto k ON k.concepto_id = i.concepto_id
+        WHERE i.centro_id = (SELECT centro_id FROM dim_centro WHERE centro = ?)
+        ORDER BY k.concepto
+    """, (centro,)).fetchall()
+    release_connection(conn)
+    return [r[0] for r in rows]
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def load_date_bounds(data_version, centro=None, concepto=None):
+    where, params = build_filters(centro, concepto, alias="i")
+    conn = get_connection()
+    min_fecha, max_fecha = conn.execute(
+        f"SELECT MIN(i.min_fecha), MAX(i.max_fecha) FROM filter_index i{where}", params
+    ).fetchone()
+    release_connection(conn)
+    bounds = month_key_to_datetime(pd.Series([min_fecha, max_fecha]))
+    return bounds.iloc[0], bounds.iloc[1]
+
+
+@st.cache_data(show_spinner=False, max_entries=FRAME_CACHE_ENTRIES, ttl=CACHE_TTL)
+def load_data(data_version=None, centro=None, concepto=None, start=None, end=None):
+    # Wide reads come from the columnar cache; a centro filter is answered
+    # faster by the SQLite index than by scanning every upload's partition
+    df = None
+    if centro is None and parquet_cache_is_current(data_version):
+        try:
+            df = read_parquet_cache(centro, concepto, start, end)
+        except (OSError, pa.ArrowException):
+            df = None
+
+    if df is None:
+        where, params = build_filters(centro, concepto, start, end)
+        conn = get_connection()
+        df = pd.read_sql_query(FRAME_SELECT + where, conn, params=params)
+        release_connection(conn)
+
+    return compact_frame(df)
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def load_rollup(data_version, centro, start=None, end=None):
+    where, params = build_filters(centro, None, start, end, alias="r")
+    conn = get_connection()
+    df = pd.read_sql_query(f"""
+        SELECT r.fecha, r.inicial, r.aportacion, r.retiro, r.rendimiento, r.saldo
+        FROM rollup_centro_month r{where}
+        ORDER BY r.fecha
+    """, conn, params=params)
+    release_connection(conn)
 
     if df.empty:
         return df
 
-    df["fecha"] = pd.to_datetime(df["fecha"])
+    df["fecha"] = month_key_to_datetime(df["fecha"])
     return df
 
 
+@st.cache_data(show_spinner=False, max_entries=FRAME_CACHE_ENTRIES, ttl=CACHE_TTL)
+def load_centro_months(data_version, start=None, end=None):
+    # Rollup rows for every centro at once, for the comparison view
+    where, params = build_filters(None, None, start, end, alias="r")
+    conn = get_connection()
+    df = pd.read_sql_query(f"""
+        SELECT r.fecha, c.centro, r.inicial, r.aportacion, r.retiro, r.rendimiento, r.saldo
+        FROM rollup_centro_month r
+        JOIN dim_centro c ON c.centro_id = r.centro_id{where}
+    """, conn, params=params)
+    release_connection(conn)
+
+    if df.empty:
+        return df
+
+    df["fecha"] = month_key_to_datetime(df["fecha"])
+    df["centro"] = df["centro"].astype("category")
+    return df
+
+
+# Detail grid: server-side pages of fact rows for the current filters
+DETAIL_LABELS = {col: label for label, col in FACT_COLUMNS.items() if col != "centro"}
+DETAIL_PAGE_SIZES = [25, 50, 100, 250]
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def load_detail_count(data_version, centro, concepto=None, start=None, end=None):
+    where, params = build_filters(centro, concepto, start, end)
+    conn = get_connection()
+    count = conn.execute(f"SELECT COUNT(*) FROM fact_capital f{where}", params).fetchone()[0]
+    release_connection(conn)
+    return count
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def load_detail_page(data_version, centro, concepto, start, end, sort, descending, limit, offset):
+    # Only the visible page leaves the database; the natural key breaks ties
+    # so consecutive pages never overlap or skip rows
+    if sort not in DETAIL_LABELS:
+        raise ValueError(sort)
+    where, params = build_filters(centro, concepto, start, end)
+    order = "k.concepto" if sort == "concepto" else f"f.{sort}"
+    conn = get_connection()
+    df = pd.read_sql_query(f"""
+        SELECT f.fecha, k.concepto, f.inicial, f.aportacion, f.retiro, f.rendimiento, f.saldo
+        FROM fact_capital f
+        JOIN dim_concepto k ON k.concepto_id = f.concepto_id{where}
+        ORDER BY {order} {"DESC" if descending else "ASC"}, f.centro_id, f.concepto_id, f.fecha
+        LIMIT ? OFFSET ?
+    """, conn, params=[*params, limit, offset])
+    release_connection(conn)
+
+    if not df.empty:
+        df["fecha"] = month_key_to_datetime(df["fecha"])
+    return df
+
+
+ISSUE_LIMIT = 500
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def load_issue_counts(data_version):
+    conn = get_connection()
+    # An 'incompleta' row stands for all the rows its upload skipped
+    rows = conn.execute(f"""
+        SELECT check_name, CAST(SUM(CASE WHEN check_name = '{INCOMPLETE_CHECK}' THEN actual ELSE 1 END) AS INTEGER)
+        FROM ingest_issues GROUP BY check_name ORDER BY check_name
+    """).fetchall()
+    release_connection(conn)
+    return dict(rows)
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def load_issues(data_version, centro):
+    where, params = build_filters(centro, alias="i")
+    conn = get_connection()
+    df = pd.read_sql_query(f"""
+        SELECT i.fecha, k.concepto, i.check_name, i.expected, i.actual
+        FROM ingest_issues i
+        JOIN dim_concepto k ON k.concepto_id = i.concepto_id{where}
+        ORDER BY i.fecha, k.concepto
+        LIMIT {ISSUE_LIMIT}
+    """, conn, params=params)
+    release_connection(conn)
+    return issues_frame(df)
+
+
+def issues_frame(df):
+    if df.empty:
+        return df
+    df["fecha"] = month_key_to_datetime(df["fecha"])
+    df["diferencia"] = df["actual"] - df["expected"]
+    return df
+
+
+# Exports walk the cursor instead of loading the result into one frame
+EXPORT_CHUNK_ROWS = 50_000
+
+
+def iter_fact_chunks(centro=None, concepto=None, start=None, end=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    # The whole table is a wide read: it streams from the Parquet cache when
+    # that is current (no joins, no SQLite read transaction held open), with
+    # SQLite as the fallback like load_data
+    if centro is None and parquet_cache_is_current():
+        try:
+            chunks = iter_parquet_chunks(chunk_rows, centro, concepto, start, end)
+            first = next(chunks, None)
+        except (OSError, pa.ArrowException):
+            first = chunks = None
+        if chunks is not None:
+            if first is not None:
+                yield first
+                yield from chunks
+            return
+
+    where, params = build_filters(centro, concepto, start, end)
+    conn = get_connection()
+    try:
+        cur = conn.execute(FRAME_SELECT + where + " ORDER BY f.centro_id, f.concepto_id, f.fecha", params)
+        while rows := cur.fetchmany(chunk_rows):
+            df = pd.DataFrame.from_records(rows, columns=FRAME_COLUMNS)
+            df["fecha"] = month_key_to_datetime(df["fecha"])
+            yield df
+    finally:
+        release_connection(conn)
+
+
 # ============================================================
 # LIST + DELETE UPLOADED FILES
 # ============================================================
 
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def load_upload_rows(data_version):
+    # Rows each upload currently holds; later uploads may have replaced some
+    conn = get_connection()
+    rows = dict(conn.execute(
+        "SELECT upload_id, COUNT(*) FROM fact_capital GROUP BY upload_id"
+    ).fetchall())
+    release_connection(conn)
+    return rows
+
+
 def get_uploads():
-    conn = sqlite3.connect("data.db")
+    conn = get_connection()
     df = pd.read_sql_query("SELECT * FROM uploads ORDER BY upload_id DESC", conn)
-    conn.close()
+    release_connection(conn)
+    df["rows"] = df["upload_id"].map(load_upload_rows(get_data_version())).fillna(0).astype(int)
     return df
 
+
+def restore_superseded(cur, upload_id):
+    # The upload leaves every key's chain of values: rows it replaced go back
+    # to fact_capital, or, where a later upload replaced it in turn, now count
+    # as replaced by that one
+    cur.execute("""
+        UPDATE fact_superseded AS below SET superseded_by = above.superseded_by
+        FROM fact_superseded AS above
+        WHERE below.superseded_by = :upload_id AND above.upload_id = :upload_id
+          AND above.centro_id = below.centro_id AND above.concepto_id = below.concepto_id
+          AND above.fecha = below.fecha
+    """, {"upload_id": upload_id})
+    cur.execute("DELETE FROM fact_superseded WHERE upload_id = ?", (upload_id,))
+    cur.execute("""
+        INSERT INTO fact_capital
+        (fecha, centro_id, concepto_id, inicial, aportacion, retiro, rendimiento, saldo, upload_id)
+        SELECT fecha, centro_id, concepto_id, inicial, aportacion, retiro, rendimiento, saldo, upload_id
+        FROM fact_superseded WHERE superseded_by = ?
+    """, (upload_id,))
+    cur.execute("DELETE FROM fact_superseded WHERE superseded_by = ?", (upload_id,))
+
+
 def delete_upload(upload_id):
-    conn = sqlite3.connect("data.db")
+    conn = get_connection()
     cur = conn.cursor()
+    try:
+        # Write lock first: in WAL a transaction that has already read can't
+        # upgrade once another connection commits, and busy_timeout won't wait
+        cur.execute("BEGIN IMMEDIATE")
+        mark_rollup_groups(cur, upload_id)
+        mark_filter_index(cur, upload_id)
+        cur.execute("DELETE FROM fact_capital WHERE upload_id = ?", (upload_id,))
+        restore_superseded(cur, upload_id)
+        rebuild_rollup_groups(cur)
+        refresh_filter_index(cur)
+        refresh_ingest_issues(cur)
+        cur.execute(
+            "DELETE FROM ingest_issues WHERE check_name = ? AND upload_id = ?", (INCOMPLETE_CHECK, upload_id)
+        )
+        cur.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,))
+        bump_data_version(cur)
+        conn.commit()
+    finally:
+        release_connection(conn)
+
+    try_sync_parquet_cache()
+
+
+# ============================================================
+# STORAGE BACKENDS (DASHBOARD_STORAGE=sqlite|duckdb)
+# ============================================================
+
+STORAGE_BACKEND = os.environ.get("DASHBOARD_STORAGE", "sqlite")
+DUCKDB_PATH = "data.duckdb"
+
+
+class SQLiteStorage:
+    # The functions above; aggregation for "Todos" comes from the rollup table
+    name = "sqlite"
+
+    def init(self):
+        ensure_db(DB_PATH)
+
+    def data_version(self):
+        return get_data_version()
+
+    def centros(self, data_version):
+        return load_centros(data_version)
+
+    def conceptos(self, data_version, centro):
+        return load_conceptos(data_version, centro)
+
+    def date_bounds(self, data_version, centro=None, concepto=None):
+        return load_date_bounds(data_version, centro, concepto)
 
-    cur.execute("DELETE FROM fact_capital WHERE upload_id = ?", (upload_id,))
-    cur.execute("DELETE FROM uploads WHERE upload_id = ?", (upload_id,))
+    def load_data(self, data_version, centro=None, concepto=None, start=None, end=None):
+        return load_data(data_version, centro, concepto, start, end)
+
+    def export_chunks(self, centro=None, concepto=None, start=None, end=None, chunk_rows=EXPORT_CHUNK_ROWS):
+        return iter_fact_chunks(centro, concepto, start, end, chunk_rows)
+
+    def load_grouped(self, data_version, centro, concepto=None, start=None, end=None):
+        if concepto is None:
+            return load_rollup(data_version, centro, start, end)
+        return load_data(data_version, centro, concepto, start, end)
+
+    def centro_months(self, data_version, start=None, end=None):
+        return load_centro_months(data_version, start, end)
+
+    def detail_count(self, data_version, centro, concepto=None, start=None, end=None):
+        return load_detail_count(data_version, centro, concepto, start, end)
+
+    def detail_page(self, data_version, centro, concepto, start, end, sort, descending, limit, offset):
+        return load_detail_page(data_version, centro, concepto, start, end, sort, descending, limit, offset)
+
+    def issue_counts(self, data_version):
+        return load_issue_counts(data_version)
+
+    def issues(self, data_version, centro):
+        return load_issues(data_version, centro)
+
+    def save_upload(self, file, streaming=False, progress=None):
+        return save_upload(file, streaming, progress)
+
+    def save_uploads(self, files, streaming=False, progress=None):
+        return save_uploads(files, streaming, progress)
+
+    def find_upload(self, file_hash):
+        return find_upload(file_hash)
+
+    def ingest_chunks(self, filename, file_hash, chunks, total=None, progress=None):
+        return ingest_chunks(filename, file_hash, chunks, total, progress)
+
+    def get_uploads(self):
+        return get_uploads()
+
+    def delete_upload(self, upload_id):
+        delete_upload(upload_id)
+
+
+@st.cache_resource
+def duckdb_connection():
+    import duckdb
+
+    return duckdb.connect(DUCKDB_PATH)
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def duckdb_read(sql, params, data_version):
+    # Every DuckDB read is cached on its query text, parameters and data version
+    cur = duckdb_connection().cursor()
+    df = cur.execute(sql, params).df()
+    cur.close()
+    return df
+
+
+class DuckDBStorage:
+    # Columnar embedded store; filters and the per-month groupby run in-engine
+    name = "duckdb"
+
+    SUMS = ", ".join(
+        f"COALESCE(SUM({col}), 0) AS {col}"
+        for col in ["inicial", "aportacion", "retiro", "rendimiento", "saldo"]
+    )
+
+    def cursor(self):
+        # Per-call cursor: the shared connection must not be used across threads
+        return duckdb_connection().cursor()
+
+    def init(self):
+        cur = self.cursor()
+        cur.execute("CREATE SEQUENCE IF NOT EXISTS upload_seq")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS uploads (
+                upload_id BIGINT PRIMARY KEY DEFAULT nextval('upload_seq'),
+                filename VARCHAR,
+                timestamp VARCHAR,
+                content_hash VARCHAR UNIQUE,
+                skipped BIGINT DEFAULT 0
+            )
+        """)
+        # Rows without fecha/centro/concepto are only counted, per upload
+        cur.execute("ALTER TABLE uploads ADD COLUMN IF NOT EXISTS skipped BIGINT DEFAULT 0")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS fact_capital (
+                fecha INTEGER,
+                centro VARCHAR,
+                concepto VARCHAR,
+                inicial DOUBLE,
+                aportacion DOUBLE,
+                retiro DOUBLE,
+                rendimiento DOUBLE,
+                saldo DOUBLE,
+                upload_id BIGINT
+            )
+        """)
+        # Replaced values, restored when the upload that replaced them is deleted
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS fact_superseded (
+                fecha INTEGER,
+                centro VARCHAR,
+                concepto VARCHAR,
+                inicial DOUBLE,
+                aportacion DOUBLE,
+                retiro DOUBLE,
+                rendimiento DOUBLE,
+                saldo DOUBLE,
+                upload_id BIGINT,
+                superseded_by BIGINT
+            )
+        """)
+        cur.execute("CREATE TABLE IF NOT EXISTS meta (key VARCHAR PRIMARY KEY, value BIGINT)")
+        cur.execute("INSERT OR IGNORE INTO meta VALUES ('data_version', 0)")
+        cur.close()
+
+    def data_version(self):
+        cur = self.cursor()
+        version = cur.execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()[0]
+        cur.close()
+        return version
+
+    def filters(self, centro=None, concepto=None, start=None, end=None):
+        clauses, params = [], []
+        if centro is not None:
+            clauses.append("centro = ?")
+            params.append(centro)
+        if concepto is not None:
+            clauses.append("concepto = ?")
+            params.append(concepto)
+        if start is not None:
+            clauses.append("fecha >= ?")
+            params.append(start_month_key(start))
+        if end is not None:
+            clauses.append("fecha <= ?")
+            params.append(month_key(end))
+
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return where, params
+
+    def centros(self, data_version):
+        df = duckdb_read("SELECT DISTINCT centro FROM fact_capital ORDER BY centro", [], data_version)
+        return df["centro"].tolist()
+
+    def conceptos(self, data_version, centro):
+        df = duckdb_read(
+            "SELECT DISTINCT concepto FROM fact_capital WHERE centro = ? ORDER BY concepto",
+            [centro], data_version,
+        )
+        return df["concepto"].tolist()
+
+    def date_bounds(self, data_version, centro=None, concepto=None):
+        where, params = self.filters(centro, concepto)
+        df = duckdb_read(
+            f"SELECT MIN(fecha) AS lo, MAX(fecha) AS hi FROM fact_capital{where}", params, data_version
+        )
+        bounds = month_key_to_datetime(pd.Series([df["lo"].iloc[0], df["hi"].iloc[0]]))
+        return bounds.iloc[0], bounds.iloc[1]
+
+    def with_dates(self, df):
+        if df.empty:
+            return df
+        df = df.copy()
+        df["fecha"] = month_key_to_datetime(df["fecha"])
+        return df
+
+    def load_data(self, data_version, centro=None, concepto=None, start=None, end=None):
+        where, params = self.filters(centro, concepto, start, end)
+        df = duckdb_read(
+            f"SELECT {', '.join(FRAME_COLUMNS)} FROM fact_capital{where}", params, data_version
+        )
+        return compact_frame(df)
+
+    def export_chunks(self, centro=None, concepto=None, start=None, end=None, chunk_rows=EXPORT_CHUNK_ROWS):
+        # Record batches straight off the result set, never the whole table
+        where, params = self.filters(centro, concepto, start, end)
+        cur = self.cursor()
+        try:
+            reader = cur.execute(
+                f"SELECT {', '.join(FRAME_COLUMNS)} FROM fact_capital{where} ORDER BY centro, concepto, fecha",
+                params,
+            ).fetch_record_batch(chunk_rows)
+            for batch in reader:
+                df = batch.to_pandas()
+                df["fecha"] = month_key_to_datetime(df["fecha"])
+                yield df
+        finally:
+            cur.close()
+
+    def load_grouped(self, data_version, centro, concepto=None, start=None, end=None):
+        if concepto is not None:
+            return self.load_data(data_version, centro, concepto, start, end)
+
+        where, params = self.filters(centro, None, start, end)
+        df = duckdb_read(
+            f"SELECT fecha, {self.SUMS} FROM fact_capital{where} GROUP BY fecha ORDER BY fecha",
+            params, data_version,
+        )
+        return self.with_dates(df)
+
+    def centro_months(self, data_version, start=None, end=None):
+        where, params = self.filters(None, None, start, end)
+        df = duckdb_read(
+            f"SELECT fecha, centro, {self.SUMS} FROM fact_capital{where} GROUP BY centro, fecha",
+            params, data_version,
+        )
+        df = self.with_dates(df)
+        if not df.empty:
+            df["centro"] = df["centro"].astype("category")
+        return df
+
+    # No derived tables on this backend: the ingest_issues checks run over
+    # the facts at read time, cached per data version like every other read
+    ISSUES = """
+        SELECT fecha, centro, concepto, 'saldo' AS check_name,
+               COALESCE(inicial, 0) + COALESCE(aportacion, 0) - COALESCE(retiro, 0) + COALESCE(rendimiento, 0) AS expected,
+               saldo AS actual
+        FROM fact_capital
+        WHERE ABS(saldo - (COALESCE(inicial, 0) + COALESCE(aportacion, 0)
+                           - COALESCE(retiro, 0) + COALESCE(rendimiento, 0))) > ?
+        UNION ALL
+        SELECT fecha, centro, concepto, 'continuidad', prev_saldo, inicial
+        FROM (
+            SELECT fecha, centro, concepto, inicial,
+                   LAG(saldo) OVER w AS prev_saldo,
+                   LAG(fecha) OVER w AS prev_fecha
+            FROM fact_capital
+            WINDOW w AS (PARTITION BY centro, concepto ORDER BY fecha)
+        )
+        WHERE prev_fecha = CASE WHEN fecha % 100 = 1 THEN fecha - 89 ELSE fecha - 1 END
+          AND ABS(inicial - prev_saldo) > ?
+    """
+
+    def detail_count(self, data_version, centro, concepto=None, start=None, end=None):
+        where, params = self.filters(centro, concepto, start, end)
+        df = duckdb_read(f"SELECT COUNT(*) AS n FROM fact_capital{where}", params, data_version)
+        return int(df["n"].iloc[0])
+
+    def detail_page(self, data_version, centro, concepto, start, end, sort, descending, limit, offset):
+        if sort not in DETAIL_LABELS:
+            raise ValueError(sort)
+        where, params = self.filters(centro, concepto, start, end)
+        df = duckdb_read(f"""
+            SELECT {", ".join(DETAIL_LABELS)} FROM fact_capital{where}
+            ORDER BY {sort} {"DESC" if descending else "ASC"}, centro, concepto, fecha
+            LIMIT ? OFFSET ?
+        """, [*params, limit, offset], data_version)
+        return self.with_dates(df)
+
+    def issue_counts(self, data_version):
+        df = duckdb_read(
+            f"SELECT check_name, COUNT(*) AS n FROM ({self.ISSUES}) GROUP BY check_name ORDER BY check_name",
+            [RECONCILE_TOLERANCE] * 2, data_version,
+        )
+        counts = dict(zip(df["check_name"], df["n"]))
+        skipped = duckdb_read("SELECT COALESCE(SUM(skipped), 0) AS n FROM uploads", [], data_version)["n"].iloc[0]
+        if skipped:
+            counts[INCOMPLETE_CHECK] = int(skipped)
+        return counts
+
+    def issues(self, data_version, centro):
+        df = duckdb_read(
+            f"""SELECT fecha, concepto, check_name, expected, actual FROM ({self.ISSUES})
+                WHERE centro = ? ORDER BY fecha, concepto LIMIT {ISSUE_LIMIT}""",
+            [RECONCILE_TOLERANCE] * 2 + [centro], data_version,
+        )
+        return issues_frame(df.copy())
+
+    def save_upload(self, file, streaming=False, progress=None):
+        return self.save_uploads([file], streaming, progress)[0]
+
+    def save_uploads(self, files, streaming=False, progress=None):
+        duplicates, items, workbooks = plan_uploads(files, streaming, self.find_upload)
+        try:
+            stats = self.ingest_uploads([item[1:] for item in items], progress) if items else []
+        finally:
+            for wb in workbooks:
+                wb.close()
+
+        results = dict(duplicates)
+        results.update(zip([item[0] for item in items], stats))
+        return [results[i] for i in range(len(files))]
+
+    def find_upload(self, file_hash):
+        cur = self.cursor()
+        existing = cur.execute(
+            "SELECT upload_id FROM uploads WHERE content_hash = ?", [file_hash]
+        ).fetchone()
+        cur.close()
+        return existing[0] if existing else None
+
+    def ingest_chunks(self, filename, file_hash, chunks, total=None, progress=None):
+        return self.ingest_uploads([(filename, file_hash, chunks, total)], progress)[0]
+
+    def ingest_uploads(self, items, progress=None):
+        cur = self.cursor()
+        names = list(FACT_COLUMNS.values())
+        grand_total = None if any(item[3] is None for item in items) else sum(item[3] for item in items)
+
+        start = time.perf_counter()
+        cur.begin()
+        try:
+            uploaded = []
+            rows = 0
+            for filename, file_hash, chunks, _ in items:
+                upload_id = cur.execute(
+                    "INSERT INTO uploads (filename, timestamp, content_hash) VALUES (?, ?, ?) RETURNING upload_id",
+                    [filename, datetime.now().isoformat(), file_hash],
+                ).fetchone()[0]
+
+                upload_rows = skipped = 0
+                for columns in chunks:
+                    batch = pd.DataFrame(dict(zip(names, columns)))
+                    complete = batch[["fecha", "centro", "concepto"]].notna().all(axis=1)
+                    skipped += int((~complete).sum())
+                    batch = batch[complete]
+                    cur.register("batch", batch)
+                    # Same natural-key upsert as the SQLite path, keeping
+                    # the values other uploads loaded
+                    cur.execute(f"""
+                        INSERT INTO fact_superseded
+                        SELECT {', '.join(f"f.{name}" for name in names)}, f.upload_id, ?
+                        FROM fact_capital f
+                        WHERE f.upload_id IS DISTINCT FROM ? AND EXISTS (
+                            SELECT 1 FROM batch b
+                            WHERE f.centro = b.centro AND f.concepto = b.concepto AND f.fecha = b.fecha
+                        )
+                    """, [upload_id, upload_id])
+                    cur.execute("""
+                        DELETE FROM fact_capital f USING batch b
+                        WHERE f.centro = b.centro AND f.concepto = b.concepto AND f.fecha = b.fecha
+                    """)
+                    cur.execute(f"INSERT INTO fact_capital SELECT {', '.join(names)}, ? FROM batch", [upload_id])
+                    cur.unregister("batch")
+                    upload_rows += len(batch)
+                    if progress:
+                        progress(rows + upload_rows, grand_total)
+                rows += upload_rows
+                uploaded.append((upload_id, upload_rows))
+                if skipped:
+                    cur.execute("UPDATE uploads SET skipped = ? WHERE upload_id = ?", [skipped, upload_id])
+
+            cur.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_version'")
+            cur.commit()
+        except Exception:
+            cur.rollback()
+            raise
+        finally:
+            cur.close()
+
+        elapsed = time.perf_counter() - start
+        return [ingest_stats(upload_id, n, elapsed) for upload_id, n in uploaded]
+
+    def get_uploads(self):
+        cur = self.cursor()
+        df = cur.execute("""
+            SELECT u.upload_id, u.filename, u.timestamp, COALESCE(f.rows, 0) AS rows
+            FROM uploads u
+            LEFT JOIN (SELECT upload_id, COUNT(*) AS rows FROM fact_capital GROUP BY upload_id) f
+                USING (upload_id)
+            ORDER BY u.upload_id DESC
+        """).df()
+        cur.close()
+        return df
 
+    def delete_upload(self, upload_id):
+        # Same restore of replaced values as restore_superseded
+        cur = self.cursor()
+        cur.begin()
+        cur.execute("DELETE FROM fact_capital WHERE upload_id = ?", [upload_id])
+        cur.execute("""
+            UPDATE fact_superseded AS below SET superseded_by = above.superseded_by
+            FROM fact_superseded AS above
+            WHERE below.superseded_by = $upload_id AND above.upload_id = $upload_id
+              AND above.centro = below.centro AND above.concepto = below.concepto
+              AND above.fecha = below.fecha
+        """, {"upload_id": upload_id})
+        cur.execute("DELETE FROM fact_superseded WHERE upload_id = ?", [upload_id])
+        cur.execute(
+            "INSERT INTO fact_capital SELECT * EXCLUDE (superseded_by) FROM fact_superseded WHERE superseded_by = ?",
+            [upload_id],
+        )
+        cur.execute("DELETE FROM fact_superseded WHERE superseded_by = ?", [upload_id])
+        cur.execute("DELETE FROM uploads WHERE upload_id = ?", [upload_id])
+        cur.execute("UPDATE meta SET value = value + 1 WHERE key = 'data_version'")
+        cur.commit()
+        cur.close()
+
+
+STORAGE_BACKENDS = {
+    "sqlite": SQLiteStorage,
+    "duckdb": DuckDBStorage,
+}
+
+
+@st.cache_resource
+def get_storage(backend=STORAGE_BACKEND):
+    storage = STORAGE_BACKENDS[backend]()
+    storage.init()
+    return storage
+
+
+def use_database(path, backend=STORAGE_BACKEND):
+    # For the command-line tools: point a backend at another file. A SQLite
+    # database keeps its own Parquet cache next to it, like data.db does
+    global DB_PATH, DUCKDB_PATH, PARQUET_DIR
+    path = os.path.abspath(path)
+    if backend == "duckdb":
+        DUCKDB_PATH = path
+    else:
+        DB_PATH = path
+        PARQUET_DIR = parquet_dir_for(path)
+    st.cache_resource.clear()
+    st.cache_data.clear()
+    return get_storage(backend)
+
+
+# ============================================================
+# EXPORT (CSV / Parquet / Excel, streamed in chunks)
+# ============================================================
+
+# Workbook headers, so an exported file can be uploaded again as-is
+EXPORT_HEADERS = {col: label for label, col in FACT_COLUMNS.items()}
+EXPORT_SCHEMA = pa.schema(
+    [(EXPORT_HEADERS["fecha"], pa.timestamp("us"))]
+    + [(EXPORT_HEADERS[col], pa.string()) for col in ["centro", "concepto"]]
+    + [(EXPORT_HEADERS[col], pa.float64()) for col in ["inicial", "aportacion", "retiro", "rendimiento", "saldo"]]
+)
+XLSX_SHEET_ROWS = 1_048_575
+
+
+def export_frames(chunks):
+    for df in chunks:
+        yield df[FRAME_COLUMNS].rename(columns=EXPORT_HEADERS)
+
+
+def csv_blocks(frames):
+    # Header once, then one text block per chunk
+    header = True
+    for df in frames:
+        yield df.to_csv(index=False, header=header, date_format="%Y-%m-%d")
+        header = False
+    if header:
+        yield ",".join(EXPORT_SCHEMA.names) + "\n"
+
+
+def write_csv(frames, f):
+    for block in csv_blocks(frames):
+        f.write(block.encode("utf-8"))
+
+
+def write_parquet(frames, f):
+    # One row group per chunk
+    with pq.ParquetWriter(f, EXPORT_SCHEMA) as writer:
+        for df in frames:
+            writer.write_table(pa.Table.from_pandas(df, schema=EXPORT_SCHEMA, preserve_index=False))
+
+
+def write_xlsx(frames, f):
+    # write_only streams rows to disk; past Excel's row limit a new sheet
+    # starts, which the multi-sheet upload path reads back
+    wb = Workbook(write_only=True)
+    ws, rows = None, XLSX_SHEET_ROWS
+    for df in frames:
+        for row in df.itertuples(index=False):
+            if rows == XLSX_SHEET_ROWS:
+                ws = wb.create_sheet("Capital" if ws is None else f"Capital {len(wb.worksheets) + 1}")
+                ws.append(EXPORT_SCHEMA.names)
+                rows = 0
+            ws.append([row[0].to_pydatetime(), *row[1:]])
+            rows += 1
+    if ws is None:
+        wb.create_sheet("Capital").append(EXPORT_SCHEMA.names)
+    wb.save(f)
+
+
+EXPORT_FORMATS = {
+    "CSV": ("csv", "text/csv", write_csv),
+    "Parquet": ("parquet", "application/vnd.apache.parquet", write_parquet),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", write_xlsx),
+}
+
+
+def export_file(storage, fmt, centro=None, concepto=None, start=None, end=None):
+    # Runs only when the download is clicked; rows go from the cursor to a
+    # temp file on disk one chunk at a time. download_button reads a returned
+    # file into memory anyway, so the bytes are returned and the file closed
+    with tempfile.TemporaryFile() as f:
+        EXPORT_FORMATS[fmt][2](export_frames(storage.export_chunks(centro, concepto, start, end)), f)
+        f.seek(0)
+        return f.read()
+
+
+# ============================================================
+# BACKGROUND INGEST WORKER
+# ============================================================
+
+JOB_POLL_SECONDS = 1.0
+JOB_ACTIVE = ["queued", "running"]
+# Recorded on every job this process creates; ingest.py sets its own
+JOB_OWNER = f"app:{os.getpid()}"
+
+log = logging.getLogger(__name__)
+
+JOB_STATUS_LABELS = {
+    "queued": "En cola",
+    "running": "Procesando",
+    "done": "Completado",
+    "skipped": "Omitido, ya estaba cargado",
+    "failed": "Error",
+}
+
+
+def create_ingest_job(filename):
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO ingest_jobs (filename, status, created, owner) VALUES (?, 'queued', ?, ?)",
+        (filename, datetime.now().isoformat(), JOB_OWNER),
+    )
+    job_id = cur.lastrowid
+    conn.commit()
+    release_connection(conn)
+    return job_id
+
+
+def update_ingest_job(job_id, **fields):
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    conn = get_connection()
+    conn.execute(
+        f"UPDATE ingest_jobs SET {assignments} WHERE job_id = ?",
+        [*fields.values(), job_id],
+    )
     conn.commit()
-    conn.close()
+    release_connection(conn)
+
+
+def get_ingest_jobs(limit=5):
+    conn = get_connection()
+    df = pd.read_sql_query(
+        "SELECT * FROM ingest_jobs ORDER BY job_id DESC LIMIT ?", conn, params=(limit,)
+    )
+    release_connection(conn)
+    return df
+
+
+def run_ingest_job(job_id, files, streaming, progress):
+    started = time.perf_counter()
+    update_ingest_job(job_id, status="running", started=datetime.now().isoformat())
+
+    # Progress stays in memory so reporting it costs no database writes
+    def report(done, total):
+        progress[job_id] = (done, total)
+
+    try:
+        stats = get_storage().save_uploads(files, streaming=streaming, progress=report)
+    except Exception as exc:
+        outcome = {"status": "failed", "error": str(exc)}
+    else:
+        loaded = [s for s in stats if not s["duplicate"]]
+        outcome = {
+            "status": "done" if loaded else "skipped",
+            "rows": sum(s["rows"] for s in loaded),
+            "upload_id": (loaded or stats)[-1]["upload_id"],
+        }
+    finally:
+        progress.pop(job_id, None)
+
+    update_ingest_job(
+        job_id, **outcome,
+        finished=datetime.now().isoformat(),
+        seconds=time.perf_counter() - started,
+    )
+
+
+def ingest_worker_loop(jobs, progress):
+    # Build any Parquet partitions missing since the last process ran
+    try_sync_parquet_cache()
+
+    # This is the only worker and it's never restarted, so nothing a job
+    # raises (not even recording its status) may end the loop; a job left
+    # "running" is marked Interrumpido when the next process starts
+    while True:
+        job_id, files, streaming = jobs.get()
+        try:
+            run_ingest_job(job_id, files, streaming, progress)
+        except Exception:
+            log.exception("Ingest job %s could not be completed", job_id)
+        finally:
+            jobs.task_done()
+
+
+@st.cache_resource
+def ingest_worker():
+    # Jobs queued or running when the last app process died can't be resumed.
+    # An ingest.py run may still be working through its own jobs, and records
+    # their outcome itself; rows from before owners were recorded count as the app's
+    conn = get_connection()
+    conn.execute("""
+        UPDATE ingest_jobs SET status = 'failed', error = 'Interrumpido'
+        WHERE status IN ('queued', 'running') AND (owner IS NULL OR owner LIKE 'app:%')
+    """)
+    conn.commit()
+    release_connection(conn)
+
+    jobs = queue.Queue()
+    progress = {}
+    thread = threading.Thread(
+        target=ingest_worker_loop, args=(jobs, progress), name="ingest-worker", daemon=True
+    )
+    thread.start()
+    return {"jobs": jobs, "progress": progress, "thread": thread}
+
+
+def enqueue_uploads(files):
+    # Copy the bytes: an UploadedFile belongs to the script run that created it.
+    # Files uploaded together are one job and one write transaction
+    copies = []
+    for file in files:
+        data = io.BytesIO(file.getvalue())
+        data.name = file.name
+        copies.append(data)
+    streaming = any(file.size > STREAMING_THRESHOLD_BYTES for file in files)
+
+    worker = ingest_worker()
+    job_id = create_ingest_job(", ".join(file.name for file in files))
+    worker["jobs"].put((job_id, copies, streaming))
+    return job_id
 
 
 # ============================================================
@@ -137,159 +2207,684 @@ def calculate_kpis(df):
     }
 
 
+KPI_LABELS = {
+    "capital_inicial": "Capital Inicial",
+    "capital_final": "Capital Final",
+    "aportaciones": "Aportaciones",
+    "retiros": "Retiros",
+    "rendimiento_total": "Rendimiento Total",
+    "rendimiento_pct": "Rendimiento %",
+}
+
+
+def calculate_kpi_matrix(df, by):
+    # calculate_kpis for every group in one sort + groupby pass: first
+    # inicial and last saldo by fecha, plus the flow sums
+    df = df.sort_values([by, "fecha"], kind="stable")
+    firsts = df.drop_duplicates(by, keep="first").set_index(by)["inicial"]
+    lasts = df.drop_duplicates(by, keep="last").set_index(by)["saldo"]
+    sums = df.groupby(by, observed=True)[["aportacion", "retiro", "rendimiento"]].sum()
+
+    matrix = pd.DataFrame({
+        "capital_inicial": firsts,
+        "capital_final": lasts,
+        "aportaciones": sums["aportacion"],
+        "retiros": sums["retiro"],
+        "rendimiento_total": sums["rendimiento"],
+    })
+    inicial = matrix["capital_inicial"].to_numpy()
+    matrix["rendimiento_pct"] = np.divide(
+        matrix["rendimiento_total"].to_numpy(), inicial,
+        out=np.zeros(len(matrix)), where=inicial > 0,
+    )
+    matrix.index = matrix.index.astype(str)
+    return matrix
+
+
 # ============================================================
-# UI CONFIGURATION
+# KPI PREFIX SUMS (date-range KPIs without re-scanning)
 # ============================================================
 
-st.set_page_config(layout="wide")
-
-# Make full-width dashboard
-st.markdown("""
-    <style>
-        .block-container {
-            padding-top: 2rem;
-            padding-left: 3rem;
-            padding-right: 3rem;
-            max-width: 95%;
+class KpiPrefixSums:
+    # Every series in one sorted layout: rows ordered by series then month,
+    # an offset per series and running totals of the flows. A date range is
+    # two binary searches inside the series and one subtraction per flow
+    FLOWS = ["aportacion", "retiro", "rendimiento"]
+
+    def __init__(self, df, keys):
+        df = df.sort_values([*keys, "fecha"], kind="stable")
+        fecha = pd.to_datetime(df["fecha"])
+        self.months = (fecha.dt.year * 100 + fecha.dt.month).to_numpy(dtype="int32")
+        self.inicial = df["inicial"].to_numpy(dtype="float64")
+        self.saldo = df["saldo"].to_numpy(dtype="float64")
+
+        flows = df[self.FLOWS].fillna(0).to_numpy(dtype="float64")
+        self.prefix = np.vstack([np.zeros((1, len(self.FLOWS))), np.cumsum(flows, axis=0)])
+
+        codes = df.groupby(keys, observed=True, sort=False).ngroup().to_numpy()
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.array([], dtype=int)
+        self.offsets = np.r_[starts, len(df)]
+        heads = df[keys].iloc[starts].astype(str).itertuples(index=False, name=None)
+        self.series = {key: i for i, key in enumerate(heads)}
+
+    def kpis(self, key, start=None, end=None):
+        s = self.series.get(key)
+        if s is None:
+            return None
+        a, b = self.offsets[s], self.offsets[s + 1]
+        months = self.months[a:b]
+        lo = a + (np.searchsorted(months, start_month_key(start)) if start is not None else 0)
+        hi = a + (np.searchsorted(months, month_key(end), side="right") if end is not None else b - a)
+        if lo >= hi:
+            return None
+
+        aportes, retiros, rendimiento_total = self.prefix[hi] - self.prefix[lo]
+        capital_inicial = self.inicial[lo]
+        return {
+            "capital_inicial": capital_inicial,
+            "capital_final": self.saldo[hi - 1],
+            "aportaciones": aportes,
+            "retiros": retiros,
+            "rendimiento_total": rendimiento_total,
+            "rendimiento_pct": rendimiento_total / capital_inicial if capital_inicial > 0 else 0,
         }
-    </style>
-""", unsafe_allow_html=True)
 
-# HEADER
-st.markdown("""
-    <h1 style='text-align:left; color:#ddd;'> Dashboard Financiero</h1>
-    <h4 style='text-align:left; color:gray;'>Análisis por Centro, Concepto y Fecha</h4>
-    <br>
-""", unsafe_allow_html=True)
+
+# Built once per data version and shared, not copied, across reruns and
+# sessions. Without a centro: one series per centro from the monthly rollup
+# (the Todos view); with one: that centro's concepto series, so only its rows
+# are loaded, never the whole fact table
+@st.cache_resource(max_entries=FRAME_CACHE_ENTRIES, show_spinner=False)
+def kpi_prefix_sums(backend, data_version, centro=None):
+    storage = get_storage(backend)
+    if centro is None:
+        return KpiPrefixSums(storage.centro_months(data_version), ["centro"])
+    return KpiPrefixSums(storage.load_data(data_version, centro), ["centro", "concepto"])
+
+
+def range_kpis(storage, data_version, centro, concepto, start, end):
+    if concepto is None:
+        prefix, key = kpi_prefix_sums(storage.name, data_version), (centro,)
+    else:
+        prefix, key = kpi_prefix_sums(storage.name, data_version, centro), (centro, concepto)
+    return prefix.kpis(key, start, end)
 
 
 # ============================================================
-# SIDEBAR
+# RETURN ENGINE (TWR / MWR)
 # ============================================================
 
-st.sidebar.header("Filtros")
+# Flows carry no day within the month, so they are assumed mid-month
+# (Modified Dietz weight 0.5, and t + 0.5 in the IRR cash flows)
+FLOW_WEIGHT = 0.5
+IRR_ITERATIONS = 50
+IRR_TOLERANCE = 1e-10
+
+RETURN_LABELS = {
+    "twr": "TWR %",
+    "mwr": "MWR (TIR) %",
+}
+
+
+def series_grid(df, by):
+    # One (series x month) array per column so every series is
+    # computed at once; months a series doesn't have stay NaN
+    monthly = df.groupby([by, "fecha"], observed=True, sort=True)[
+        ["inicial", "aportacion", "retiro", "saldo"]
+    ].sum()
+    s_codes, series = pd.factorize(monthly.index.get_level_values(0), sort=True)
+    m_codes, _ = pd.factorize(monthly.index.get_level_values(1), sort=True)
+    shape = (len(series), m_codes.max() + 1)
+
+    def grid(col):
+        out = np.full(shape, np.nan)
+        out[s_codes, m_codes] = monthly[col].to_numpy(dtype="float64")
+        return out
+
+    return series.astype(str), {col: grid(col) for col in monthly.columns}
+
+
+def calculate_returns(df, by):
+    series, g = series_grid(df, by)
+    n_series, n_months = g["inicial"].shape
+    present = ~np.isnan(g["inicial"])
+
+    begin = np.nan_to_num(g["inicial"])
+    end = np.nan_to_num(g["saldo"])
+    flows = np.nan_to_num(g["aportacion"]) - np.nan_to_num(g["retiro"])
+
+    # Time-weighted: Modified Dietz per month, chain-linked
+    denom = begin + FLOW_WEIGHT * flows
+    monthly_r = np.divide(end - begin - flows, denom, out=np.zeros_like(denom), where=present & (denom > 0))
+    twr = np.prod(1 + monthly_r, axis=1) - 1
+
+    # Money-weighted: monthly IRR r solving
+    #   B0 (1+r)^T + sum C_t (1+r)^(T - t - 0.5) = B_T
+    # with Newton steps applied to all series together
+    rows = np.arange(n_series)
+    first = present.argmax(axis=1)
+    last = n_months - 1 - present[:, ::-1].argmax(axis=1)
+    periods = (last - first + 1).astype("float64")
+    b0 = begin[rows, first]
+    bt = end[rows, last]
+    expo = periods[:, None] - (np.arange(n_months)[None, :] - first[:, None] + FLOW_WEIGHT)
+    expo = np.where(present, expo, 0.0)
+
+    # An inicial that doesn't match the previous saldo is money that moved
+    # outside the recorded flows; count it as a flow at the start of the
+    # month so the IRR sees the same balances the monthly returns do
+    prev_end = np.concatenate([np.full((n_series, 1), np.nan), g["saldo"][:, :-1]], axis=1)
+    carry = np.nan_to_num(g["inicial"] - prev_end)
+    carry_expo = np.where(present, expo + FLOW_WEIGHT, 0.0)
+
+    rate = np.full(n_series, 0.005)
+    for _ in range(IRR_ITERATIONS):
+        growth = 1 + rate
+        powers = growth[:, None] ** expo
+        carry_powers = growth[:, None] ** carry_expo
+        value = (
+            b0 * growth ** periods
+            + (flows * powers).sum(axis=1)
+            + (carry * carry_powers).sum(axis=1)
+            - bt
+        )
+        slope = (
+            b0 * periods * growth ** (periods - 1)
+            + (flows * expo * powers).sum(axis=1) / growth
+            + (carry * carry_expo * carry_powers).sum(axis=1) / growth
+        )
+        step = np.divide(value, slope, out=np.zeros(n_series), where=slope != 0)
+        rate = np.maximum(rate - step, -0.99)
+        if np.all(np.abs(step) < IRR_TOLERANCE):
+            break
+
+    invested = b0 + np.clip(flows, 0, None).sum(axis=1) + np.clip(carry, 0, None).sum(axis=1)
+    mwr = np.where(invested > 0, (1 + rate) ** periods - 1, np.nan)
 
-df = load_data()
+    return pd.DataFrame({"twr": twr, "mwr": mwr}, index=pd.Index(series, name=by))
 
-if df.empty:
-    st.sidebar.warning("No hay datos cargados aún.")
-    st.stop()
 
-# --- Centro
-centro = st.sidebar.selectbox("Centro", sorted(df["centro"].unique()))
-df_filtered = df[df["centro"] == centro]
+# ============================================================
+# CHART DOWNSAMPLING (point budget per series)
+# ============================================================
+
+CHART_POINT_BUDGET = int(os.environ.get("DASHBOARD_CHART_POINTS", 1000))
+
+
+def lttb_indices(x, y, budget):
+    # Largest-Triangle-Three-Buckets; first and last points are always kept
+    n = len(y)
+    if budget >= n or budget < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, budget - 1).astype(int)
+    # The average of each next bucket doesn't depend on what gets picked, so
+    # all of them come from one cumulative-sum pass
+    csx = np.concatenate([[0.0], np.cumsum(x)])
+    csy = np.concatenate([[0.0], np.cumsum(y)])
+    next_start = edges[1:]
+    next_end = np.append(edges[2:], n)
+    avg_x = (csx[next_end] - csx[next_start]) / (next_end - next_start)
+    avg_y = (csy[next_end] - csy[next_start]) / (next_end - next_start)
+
+    selected = np.empty(budget, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(budget - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs(
+            (x[a] - avg_x[i]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (avg_y[i] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
 
-# --- Concepto
-conceptos = sorted(df_filtered["concepto"].unique())
-concepto = st.sidebar.selectbox("Concepto", ["Todos"] + conceptos)
+def minmax_indices(x, y, budget):
+    # Keeps each bucket's extremes, so spikes survive; all buckets at once,
+    # with two points of the budget left for the endpoints
+    n = len(y)
+    buckets = (budget - 2) // 2
+    if budget >= n or buckets < 2:
+        return np.arange(n)
 
-if concepto != "Todos":
-    df_filtered = df_filtered[df_filtered["concepto"] == concepto]
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    idx = edges[:-1, None] + np.arange(np.diff(edges).max())
+    valid = idx < edges[1:, None]
+    idx = np.minimum(idx, n - 1)
+    values = y[idx]
+    rows = np.arange(buckets)
+    low = idx[rows, np.where(valid, values, np.inf).argmin(axis=1)]
+    high = idx[rows, np.where(valid, values, -np.inf).argmax(axis=1)]
+    return np.unique(np.concatenate([[0, n - 1], low, high]))
 
-# --- Rango de fechas
-st.sidebar.markdown("### Rango de fechas")
-min_date = df_filtered["fecha"].min()
-max_date = df_filtered["fecha"].max()
 
-date_range = st.sidebar.date_input("Selecciona rango", [min_date, max_date])
+DOWNSAMPLE_METHODS = {"LTTB": lttb_indices, "Mín/Máx": minmax_indices}
 
-if len(date_range) == 2:
-    start_date, end_date = date_range
-    df_filtered = df_filtered[(df_filtered["fecha"] >= pd.to_datetime(start_date)) &
-                              (df_filtered["fecha"] <= pd.to_datetime(end_date))]
+
+def axis_values(values):
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        values = values.astype("datetime64[ns]").astype(np.int64)
+    return values.astype(float)
+
+
+def downsample(df, x, y, budget, method="LTTB", by=None):
+    # df sorted by x within each series; series under budget pass untouched
+    pick = DOWNSAMPLE_METHODS[method]
+    groups = [df] if by is None else [g for _, g in df.groupby(by, sort=False)]
+    parts = [
+        g.iloc[pick(axis_values(g[x]), g[y].to_numpy(dtype=float), budget)]
+        for g in groups
+    ]
+    return pd.concat(parts) if parts else df
 
 
 # ============================================================
-# GROUPING (ALL CONCEPTS)
+# SALDO BY CONCEPTO (stacked evolution)
 # ============================================================
 
-if concepto == "Todos":
-    df_grouped = df_filtered.groupby("fecha").agg({
-        "inicial": "sum",
-        "aportacion": "sum",
-        "retiro": "sum",
-        "rendimiento": "sum",
-        "saldo": "sum"
-    }).reset_index()
-else:
-    df_grouped = df_filtered.copy()
+STACK_TOP_N = 6
+STACK_OTHERS = "Otros"
+
+
+# One pivot per centro and data version, so switching back to a centro
+# already seen is a cache hit; the date range is applied on the small result
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL)
+def concepto_stack(backend, data_version, centro, top_n=STACK_TOP_N):
+    df = get_storage(backend).load_data(data_version, centro)
+    if df.empty:
+        return pd.DataFrame()
+
+    # (fecha, concepto) is unique within a centro, so the pivot is a single
+    # scatter into a dense month x concepto grid
+    fecha_codes, fechas = pd.factorize(df["fecha"], sort=True)
+    concepto_codes, conceptos = pd.factorize(df["concepto"])
+    grid = np.zeros((len(fechas), len(conceptos)))
+    grid[fecha_codes, concepto_codes] = df["saldo"].to_numpy(dtype=float)
+
+    # Largest conceptos by saldo over the whole history keep their own band
+    order = np.argsort(-grid.sum(axis=0), kind="stable")
+    top, rest = order[:top_n], order[top_n:]
+    stack = pd.DataFrame(grid[:, top], index=pd.Index(fechas, name="fecha"), columns=conceptos[top])
+    if len(rest):
+        stack[STACK_OTHERS] = grid[:, rest].sum(axis=1)
+    return stack
 
 
 # ============================================================
-# SIDEBAR – UPLOAD CONTROL
+# UI CONFIGURATION
 # ============================================================
 
-st.sidebar.markdown("---")
-st.sidebar.header(" Archivos")
+def jobs_active(jobs):
+    return bool(jobs["status"].isin(JOB_ACTIVE).any())
 
-uploaded = st.sidebar.file_uploader("Subir archivo Excel", type=["xlsx"])
-if uploaded:
-    save_upload(uploaded)
-    st.sidebar.success("✔ Archivo cargado exitosamente. Recarga para verlo.")
 
-uploads_df = get_uploads()
+def ingest_jobs_panel(data_version, polling=False):
+    jobs = get_ingest_jobs()
+    progress = ingest_worker()["progress"]
 
-if len(uploads_df) > 0:
-    upload_list = {
-        f"{row['filename']} — {row['timestamp']}": row["upload_id"]
-        for _, row in uploads_df.iterrows()
-    }
+    for _, job in jobs.iterrows():
+        label = JOB_STATUS_LABELS.get(job["status"], job["status"])
+        if job["status"] == "running":
+            done, total = progress.get(job["job_id"], (0, None))
+            fraction = min(done / total, 1.0) if total else 0.0
+            st.progress(fraction, text=f"{job['filename']}: {done:,} filas")
+        elif job["status"] == "done":
+            st.caption(f"✔ {job['filename']} — {label}, {job['rows']:,.0f} filas en {job['seconds']:.1f} s")
+        elif job["status"] == "skipped":
+            st.caption(f"↺ {job['filename']} — {label}")
+        elif job["status"] == "failed":
+            st.caption(f"✖ {job['filename']} — {label}: {job['error']}")
+        else:
+            st.caption(f"… {job['filename']} — {label}")
 
-    selected_upload = st.sidebar.selectbox("Archivos cargados", list(upload_list.keys()))
+    # A finished job bumps data_version; rerun the whole app to show it. The
+    # full rerun also stops the polling once nothing is queued or running
+    if get_storage().data_version() != data_version or (polling and not jobs_active(jobs)):
+        st.rerun()
 
-    if st.sidebar.button(" Borrar archivo seleccionado"):
-        delete_upload(upload_list[selected_upload])
-        st.sidebar.success("Archivo borrado. Recarga la página.")
 
-else:
-    st.sidebar.write("No hay archivos cargados.")
+def show_ingest_jobs(data_version):
+    # Polls only while a job is queued or running, so idle sessions don't
+    # query ingest_jobs every second
+    polling = jobs_active(get_ingest_jobs())
+    run_every = JOB_POLL_SECONDS if polling else None
+    st.fragment(ingest_jobs_panel, run_every=run_every)(data_version, polling)
 
 
-# ============================================================
-# KPIs PANEL
-# ============================================================
+def main():
+    st.session_state["perf_stages"] = []
+    ensure_db(DB_PATH)
 
-if df_grouped.empty:
-    st.warning("No hay datos para los filtros seleccionados.")
-    st.stop()
+    st.set_page_config(layout="wide")
 
-kpis = calculate_kpis(df_grouped)
+    # Make full-width dashboard
+    st.markdown("""
+        <style>
+            .block-container {
+                padding-top: 2rem;
+                padding-left: 3rem;
+                padding-right: 3rem;
+                max-width: 95%;
+            }
+        </style>
+    """, unsafe_allow_html=True)
 
-title = f" KPIs — Centro: **{centro}**"
-if concepto != "Todos":
-    title += f", Concepto: **{concepto}**"
+    # HEADER
+    st.markdown("""
+        <h1 style='text-align:left; color:#ddd;'> Dashboard Financiero</h1>
+        <h4 style='text-align:left; color:gray;'>Análisis por Centro, Concepto y Fecha</h4>
+        <br>
+    """, unsafe_allow_html=True)
 
-st.markdown(f"### {title}", unsafe_allow_html=True)
 
-col1, col2, col3, col4, col5 = st.columns(5)
+    # ============================================================
+    # SIDEBAR
+    # ============================================================
 
-col1.metric("Capital Inicial", f"${kpis['capital_inicial']:,.2f}")
-col2.metric("Capital Final", f"${kpis['capital_final']:,.2f}")
-col3.metric("Aportaciones", f"${kpis['aportaciones']:,.2f}")
-col4.metric("Retiros", f"${kpis['retiros']:,.2f}")
-col5.metric("Rendimiento Total", f"${kpis['rendimiento_total']:,.2f}")
+    st.sidebar.header("Filtros")
 
-col6 = st.columns(1)[0]
-col6.metric("Rendimiento %", f"{kpis['rendimiento_pct']*100:.2f}%")
+    started = time.perf_counter()
+    storage = get_storage()
+    data_version = storage.data_version()
+    centros = storage.centros(data_version)
 
-st.markdown("---")
+    if not centros:
+        st.sidebar.warning("No hay datos cargados aún.")
+        st.stop()
 
+    # --- Centro
+    centro = st.sidebar.selectbox("Centro", centros)
 
-# ============================================================
-# CHART
-# ============================================================
+    # --- Concepto
+    conceptos = storage.conceptos(data_version, centro)
+    concepto = st.sidebar.selectbox("Concepto", ["Todos"] + conceptos)
+    concepto_filter = None if concepto == "Todos" else concepto
 
-st.subheader(" Evolución del Capital (Saldo mensual)")
+    # --- Rango de fechas
+    st.sidebar.markdown("### Rango de fechas")
+    min_date, max_date = storage.date_bounds(data_version, centro, concepto_filter)
 
-df_plot = df_grouped.sort_values("fecha")
-st.line_chart(df_plot[["fecha", "saldo"]].set_index("fecha"))
+    date_range = st.sidebar.date_input("Selecciona rango", [min_date, max_date])
 
-st.markdown("---")
+    start_date = end_date = None
+    if len(date_range) == 2:
+        start_date, end_date = date_range
 
+    perf_record("filtros sidebar", started)
 
-# ============================================================
-# TABLE
-# ============================================================
 
-with st.expander("📄 Ver datos detallados"):
-    st.dataframe(df_grouped)
+    # ============================================================
+    # GROUPING (ALL CONCEPTS)
+    # ============================================================
+
+    # "Todos" is aggregated per month by the storage backend, never in pandas
+    started = time.perf_counter()
+    df_grouped = storage.load_grouped(data_version, centro, concepto_filter, start_date, end_date)
+    perf_record("load_grouped", started, df_grouped)
+
+    perf_context = {"backend": STORAGE_BACKEND, "data_version": data_version, "centro": centro, "concepto": concepto}
+
+
+    # ============================================================
+    # SIDEBAR – UPLOAD CONTROL
+    # ============================================================
+
+    st.sidebar.markdown("---")
+    st.sidebar.header(" Archivos")
+
+    uploaded = st.sidebar.file_uploader("Subir archivos Excel", type=["xlsx"], accept_multiple_files=True)
+    # The uploader keeps returning the same files on every rerun; queue each once
+    queued = st.session_state.setdefault("queued_file_ids", set())
+    new_files = [file for file in uploaded if file.file_id not in queued]
+    if new_files:
+        enqueue_uploads(new_files)
+        queued.update(file.file_id for file in new_files)
+
+
+    with st.sidebar:
+        show_ingest_jobs(data_version)
+
+    uploads_df = storage.get_uploads()
+
+    if len(uploads_df) > 0:
+        upload_list = {
+            f"{row['filename']} — {row['timestamp']} · {row['rows']:,} filas": row["upload_id"]
+            for _, row in uploads_df.iterrows()
+        }
+
+        selected_upload = st.sidebar.selectbox("Archivos cargados", list(upload_list.keys()))
+
+        if st.sidebar.button(" Borrar archivo seleccionado"):
+            storage.delete_upload(upload_list[selected_upload])
+            st.sidebar.success("Archivo borrado. Recarga la página.")
+
+    else:
+        st.sidebar.write("No hay archivos cargados.")
+
+    # --- Validación de saldos
+    st.sidebar.markdown("### Validación")
+    issue_counts = storage.issue_counts(data_version)
+    if not issue_counts:
+        st.sidebar.caption("✔ Todos los saldos concilian")
+    for check, count in issue_counts.items():
+        st.sidebar.caption(f"⚠️ {count:,} filas: {ISSUE_LABELS.get(check, check)}")
+
+    centro_issues = storage.issues(data_version, centro)
+    if not centro_issues.empty:
+        with st.sidebar.expander(f"Incidencias en {centro}"):
+            st.dataframe(
+                centro_issues.assign(check_name=centro_issues["check_name"].map(ISSUE_LABELS))
+                .rename(columns={
+                    "fecha": "Fecha", "concepto": "Concepto", "check_name": "Revisión",
+                    "expected": "Esperado", "actual": "Registrado", "diferencia": "Diferencia",
+                }),
+                hide_index=True,
+                column_config={
+                    "Fecha": st.column_config.DateColumn(format="YYYY-MM"),
+                    **{c: st.column_config.NumberColumn(format="$%.2f") for c in ["Esperado", "Registrado", "Diferencia"]},
+                },
+            )
+            if len(centro_issues) == ISSUE_LIMIT:
+                st.caption(f"Se muestran las primeras {ISSUE_LIMIT:,}")
+
+
+    # ============================================================
+    # KPIs PANEL
+    # ============================================================
+
+    if df_grouped.empty:
+        st.warning("No hay datos para los filtros seleccionados.")
+        render_perf_panel(perf_context)
+        st.stop()
+
+    started = time.perf_counter()
+    kpis = range_kpis(storage, data_version, centro, concepto_filter, start_date, end_date) or calculate_kpis(df_grouped)
+    perf_record("range_kpis", started)
+
+    title = f" KPIs — Centro: **{centro}**"
+    if concepto != "Todos":
+        title += f", Concepto: **{concepto}**"
+
+    st.markdown(f"### {title}", unsafe_allow_html=True)
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+
+    col1.metric("Capital Inicial", f"${kpis['capital_inicial']:,.2f}")
+    col2.metric("Capital Final", f"${kpis['capital_final']:,.2f}")
+    col3.metric("Aportaciones", f"${kpis['aportaciones']:,.2f}")
+    col4.metric("Retiros", f"${kpis['retiros']:,.2f}")
+    col5.metric("Rendimiento Total", f"${kpis['rendimiento_total']:,.2f}")
+
+    started = time.perf_counter()
+    returns = calculate_returns(df_grouped.assign(serie=centro), "serie").iloc[0]
+    perf_record("calculate_returns", started)
+
+    col6, col7, col8 = st.columns(3)
+    col6.metric("Rendimiento %", f"{kpis['rendimiento_pct']*100:.2f}%")
+    col7.metric(RETURN_LABELS["twr"], f"{returns['twr']*100:.2f}%", help="Modified Dietz mensual encadenado")
+    col8.metric(
+        RETURN_LABELS["mwr"],
+        "—" if pd.isna(returns["mwr"]) else f"{returns['mwr']*100:.2f}%",
+        help="Tasa interna de retorno del periodo",
+    )
+
+    st.markdown("---")
+
+
+    # ============================================================
+    # CHART
+    # ============================================================
+
+    st.subheader(" Evolución del Capital (Saldo mensual)")
+
+    started = time.perf_counter()
+    df_plot = df_grouped.sort_values("fecha")
+
+    by_concepto = False
+    with st.popover("⚙️ Opciones de gráfica"):
+        if concepto_filter is None:
+            by_concepto = st.radio("Vista", ["Total", "Por concepto"], horizontal=True) == "Por concepto"
+            top_n = st.number_input("Conceptos con banda propia", min_value=1, max_value=20, value=STACK_TOP_N)
+        method = st.radio("Reducción de puntos", list(DOWNSAMPLE_METHODS), horizontal=True)
+        budget = st.number_input("Puntos máximos por serie", min_value=50, max_value=100_000, value=CHART_POINT_BUDGET, step=50)
+
+    # Zooming re-samples only the visible window, so a narrow enough
+    # window is drawn at full resolution
+    fechas = df_plot["fecha"].drop_duplicates().tolist()
+    if len(fechas) > 2:
+        zoom = st.select_slider(
+            "Acercar", options=fechas, value=(fechas[0], fechas[-1]),
+            format_func=lambda d: d.strftime("%Y-%m-%d"),
+        )
+        df_plot = df_plot[df_plot["fecha"].between(*zoom)]
+
+    if by_concepto:
+        # Bands share their x values, so the points are picked on the total
+        stack = concepto_stack(storage.name, data_version, centro, top_n)
+        stack = stack[stack.index.isin(df_plot["fecha"])]
+        df_chart = stack.iloc[DOWNSAMPLE_METHODS[method](axis_values(stack.index), stack.sum(axis=1).to_numpy(), budget)]
+        st.area_chart(df_chart)
+        points = len(stack)
+    else:
+        df_chart = downsample(df_plot, "fecha", "saldo", budget, method)
+        st.line_chart(df_chart[["fecha", "saldo"]].set_index("fecha"))
+        points = len(df_plot)
+    if len(df_chart) < points:
+        st.caption(f"{len(df_chart):,} de {points:,} puntos ({method}); acerca la vista para ver todos")
+    perf_record("render gráfica", started, df_chart)
+
+    st.markdown("---")
+
+
+    # ============================================================
+    # TABLE
+    # ============================================================
+
+    # Tracks its open state so nothing is queried while it's collapsed
+    started = time.perf_counter()
+    detail = st.expander("📄 Ver datos detallados", key="detalle", on_change="rerun")
+    if detail.open:
+        with detail:
+            total_rows = storage.detail_count(data_version, centro, concepto_filter, start_date, end_date)
+
+            col_sort, col_desc, col_size, col_page = st.columns([2, 1, 1, 1])
+            sort_label = col_sort.selectbox("Ordenar por", list(DETAIL_LABELS.values()))
+            descending = col_desc.toggle("Descendente")
+            page_size = col_size.selectbox("Filas por página", DETAIL_PAGE_SIZES, index=1)
+            pages = max(1, -(-total_rows // page_size))
+            page = col_page.number_input("Página", min_value=1, max_value=pages, value=1, step=1)
+
+            offset = (page - 1) * page_size
+            sort_col = {label: col for col, label in DETAIL_LABELS.items()}[sort_label]
+            df_page = storage.detail_page(
+                data_version, centro, concepto_filter, start_date, end_date,
+                sort_col, descending, page_size, offset,
+            )
+            st.dataframe(
+                df_page.rename(columns=DETAIL_LABELS),
+                hide_index=True,
+                column_config={
+                    "Fecha": st.column_config.DateColumn(format="YYYY-MM"),
+                    **{label: st.column_config.NumberColumn(format="$%.2f") for label in list(DETAIL_LABELS.values())[2:]},
+                },
+            )
+            st.caption(f"Filas {min(offset + 1, total_rows):,}–{offset + len(df_page):,} de {total_rows:,} · página {page} de {pages}")
+            st.caption(f"{len(df_grouped):,} filas · {format_bytes(frame_memory(df_grouped))} en memoria")
+    perf_record("render tabla", started, df_grouped)
+
+
+    # ============================================================
+    # EXPORT
+    # ============================================================
+
+    # Nothing is built until a button is clicked
+    col_fmt, col_view, col_all = st.columns([2, 1, 1])
+    export_format = col_fmt.radio("Exportar como", list(EXPORT_FORMATS), horizontal=True)
+    ext, mime, _ = EXPORT_FORMATS[export_format]
+    col_view.download_button(
+        "⬇️ Vista filtrada",
+        data=partial(export_file, storage, export_format, centro, concepto_filter, start_date, end_date),
+        file_name=f"capital_filtrado.{ext}", mime=mime, on_click="ignore",
+    )
+    col_all.download_button(
+        "⬇️ fact_capital completo",
+        data=partial(export_file, storage, export_format),
+        file_name=f"fact_capital.{ext}", mime=mime, on_click="ignore",
+    )
+
+    st.markdown("---")
+
+
+    # ============================================================
+    # COMPARISON (KPI LEADERBOARD)
+    # ============================================================
+
+    started = time.perf_counter()
+    with st.expander("🏆 Comparativo"):
+        compare_by = st.radio(
+            "Comparar", ["Centros", f"Conceptos de {centro}"], horizontal=True
+        )
+
+        if compare_by == "Centros":
+            df_compare = storage.centro_months(data_version, start_date, end_date)
+            compare_key = "centro"
+        else:
+            df_compare = storage.load_data(data_version, centro, None, start_date, end_date)
+            compare_key = "concepto"
+
+        if df_compare.empty:
+            st.write("Sin datos para comparar.")
+        else:
+            matrix = calculate_kpi_matrix(df_compare, compare_key).join(
+                calculate_returns(df_compare, compare_key)
+            )
+            labels = {**KPI_LABELS, **RETURN_LABELS}
+            sort_label = st.selectbox("Ordenar por", list(labels.values()), index=5)
+            sort_col = {v: k for k, v in labels.items()}[sort_label]
+
+            leaderboard = matrix.sort_values(sort_col, ascending=False)
+            leaderboard[["rendimiento_pct", "twr", "mwr"]] *= 100
+            leaderboard.insert(0, "#", range(1, len(leaderboard) + 1))
+            leaderboard = leaderboard.rename(columns=labels)
+            leaderboard.index.name = compare_key.capitalize()
+
+            money = {label: st.column_config.NumberColumn(format="$%.2f") for label in list(KPI_LABELS.values())[:5]}
+            pct = {label: st.column_config.NumberColumn(format="%.2f%%") for label in list(labels.values())[5:]}
+            st.dataframe(leaderboard, column_config={**money, **pct})
+    perf_record("comparativo", started)
+
+
+    # ============================================================
+    # PERFORMANCE PANEL
+    # ============================================================
+
+    render_perf_panel(perf_context)
+
+
+# Streamlit runs this file as __main__; generate_data.py and benchmark.py
+# import it for the data layer only
+if __name__ == "__main__":
+    main()
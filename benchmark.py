@@ -0,0 +1,161 @@
+import argparse
+import csv
+import io
+import os
+import subprocess
+import time
+from datetime import datetime
+
+import app
+import generate_data
+
+# ============================================================
+# SCALE BENCHMARK
+# ============================================================
+
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000]
+RESULT_FIELDS = [
+    "run", "commit", "backend", "source", "rows", "centros", "conceptos",
+    "months", "stage", "seconds", "rows_out",
+]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def scale_shape(rows, conceptos, months):
+    centros = max(1, round(rows / (conceptos * months)))
+    return centros, conceptos, months
+
+
+class TimedChunks:
+    # Wraps the generator so its own time can be left out of the ingest stage
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.seconds = 0.0
+
+    def __iter__(self):
+        while True:
+            started = time.perf_counter()
+            chunk = next(self.chunks, None)
+            self.seconds += time.perf_counter() - started
+            if chunk is None:
+                return
+            yield chunk
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def run_scale(rows, args, record):
+    centros, conceptos, months = scale_shape(rows, args.conceptos, args.months)
+    workdir = os.path.join(args.workdir, f"{args.backend}_{rows}")
+    os.makedirs(workdir, exist_ok=True)
+    ext = "duckdb" if args.backend == "duckdb" else "db"
+    db_path = os.path.join(workdir, f"bench.{ext}")
+    for stale in [db_path, db_path + "-wal", db_path + "-shm", db_path + ".wal"]:
+        if os.path.exists(stale):
+            os.remove(stale)
+
+    storage = app.use_database(db_path, args.backend)
+    chunks = generate_data.generate_chunks(centros, conceptos, months)
+    shape = {"rows": rows, "centros": centros, "conceptos": conceptos, "months": months}
+
+    # Ingest: the workbook path parses Excel, the generated path feeds
+    # frames straight into the same insert/rollup/index code
+    if args.source == "xlsx":
+        if centros * conceptos * months > generate_data.XLSX_MAX_ROWS:
+            print(f"  {rows:,} filas no caben en una hoja de Excel; se omite esta escala")
+            return
+        xlsx_path = os.path.join(workdir, "bench.xlsx")
+        generate_data.write_xlsx(xlsx_path, chunks)
+        with open(xlsx_path, "rb") as f:
+            upload = io.BytesIO(f.read())
+        upload.name = "bench.xlsx"
+        stats, seconds = timed(storage.save_upload, upload, True)
+    else:
+        source = TimedChunks(chunks)
+        stats, seconds = timed(
+            storage.ingest_chunks, "bench", f"bench:{rows}",
+            map(app.frame_to_columns, source), centros * conceptos * months,
+        )
+        seconds -= source.seconds
+    record(shape, "ingest", seconds, stats["rows"])
+
+    version = storage.data_version()
+    centro = generate_data.centro_name(0)
+    concepto = generate_data.concepto_name(0)
+    start, end = storage.date_bounds(version, centro, None)
+    mid = start + (end - start) / 2
+
+    # Read stages start cold; the second full load shows the cache hit
+    app.st.cache_data.clear()
+    df, seconds = timed(storage.load_data, version)
+    record(shape, "load", seconds, len(df))
+    df, seconds = timed(storage.load_data, version)
+    record(shape, "load (cache)", seconds, len(df))
+
+    df, seconds = timed(storage.load_data, version, centro, concepto, start, mid)
+    record(shape, "filter", seconds, len(df))
+
+    grouped, seconds = timed(storage.load_grouped, version, centro, None, start, end)
+    record(shape, "group centro", seconds, len(grouped))
+    months_df, seconds = timed(storage.centro_months, version, start, end)
+    record(shape, "group centros", seconds, len(months_df))
+
+    _, seconds = timed(app.calculate_kpis, grouped)
+    record(shape, "calculate_kpis", seconds, 1)
+    matrix, seconds = timed(app.calculate_kpi_matrix, months_df, "centro")
+    record(shape, "calculate_kpi_matrix", seconds, len(matrix))
+    returns, seconds = timed(app.calculate_returns, months_df, "centro")
+    record(shape, "calculate_returns", seconds, len(returns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide ingesta, carga, filtros, agrupación y KPIs a varias escalas")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="filas por escala")
+    parser.add_argument("--conceptos", type=int, default=5, help="conceptos por centro")
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument("--backend", choices=sorted(app.STORAGE_BACKENDS), default="sqlite")
+    parser.add_argument("--source", choices=["generated", "xlsx"], default="generated")
+    parser.add_argument("--workdir", default="bench_data")
+    parser.add_argument("--out", default="bench_results.csv", help="CSV al que se agregan los resultados")
+    args = parser.parse_args()
+
+    run = datetime.now().isoformat(timespec="seconds")
+    commit = git_commit()
+    new_file = not os.path.exists(args.out)
+
+    with open(args.out, "a", newline="", encoding="utf-8") as out:
+        writer = csv.DictWriter(out, fieldnames=RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+
+        def record(shape, stage, seconds, rows_out):
+            writer.writerow({
+                "run": run, "commit": commit, "backend": args.backend, "source": args.source,
+                **shape, "stage": stage, "seconds": round(seconds, 6), "rows_out": rows_out,
+            })
+            out.flush()
+            print(f"  {stage:<22} {seconds * 1000:>12,.1f} ms  {rows_out:>12,} filas")
+
+        for rows in args.scales:
+            print(f"{rows:,} filas ({args.backend}, {args.source})")
+            run_scale(rows, args, record)
+
+    print(f"Resultados agregados a {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import argparse
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+import app
+
+# ============================================================
+# SYNTHETIC fact_capital DATA
+# ============================================================
+
+# Shaped after data.db: ~5 conceptos per centro, aportaciones in ~6% and
+# retiros in ~7% of months, balances in the millions, ~0.5% monthly yield
+CONCEPTO_NAMES = [
+    "Fondo de Reserva",
+    "Proyecto Tecnología",
+    "Construcción Campus",
+    "Remodelación de oficinas",
+    "Inversiones",
+    "Fondo de Salud",
+    "Donativo",
+    "Becas",
+    "Mejoras en preparatoria",
+    "Proyecto Innovación",
+]
+APORTACION_RATE = 0.06
+RETIRO_RATE = 0.07
+XLSX_MAX_ROWS = 1_048_575
+SERIES_PER_CHUNK = 20_000
+
+
+def centro_name(i):
+    return f"Centro Sintético {i + 1:05d}, S.C."
+
+
+def concepto_name(j):
+    base = CONCEPTO_NAMES[j % len(CONCEPTO_NAMES)]
+    return base if j < len(CONCEPTO_NAMES) else f"{base} {j // len(CONCEPTO_NAMES) + 1}"
+
+
+def generate_chunks(centros, conceptos, months, start="2020-01", seed=0):
+    # Yields frames with the workbook's columns, SERIES_PER_CHUNK series at a
+    # time; every month is simulated for all series of a chunk at once
+    rng = np.random.default_rng(seed)
+    fechas = pd.date_range(start, periods=months, freq="MS")
+    n_series = centros * conceptos
+
+    for first in range(0, n_series, SERIES_PER_CHUNK):
+        ids = np.arange(first, min(first + SERIES_PER_CHUNK, n_series))
+        n = len(ids)
+
+        balance = np.round(rng.lognormal(14.2, 1.3, n), 2)
+        balance[rng.random(n) < 0.1] = 0.0
+        base_yield = rng.normal(0.005, 0.001, n)
+
+        cols = {name: np.empty((n, months)) for name in ["inicial", "aportacion", "retiro", "rendimiento", "saldo"]}
+        for m in range(months):
+            inicial = balance
+            aportacion = np.where(
+                rng.random(n) < APORTACION_RATE, np.round(rng.lognormal(12.5, 1.0, n), -2), 0.0
+            )
+            retiro = np.where(
+                rng.random(n) < RETIRO_RATE, np.round(inicial * rng.uniform(0.05, 0.5, n), 2), 0.0
+            )
+            rendimiento = np.round(inicial * (base_yield + rng.normal(0, 0.001, n)), 2)
+            balance = np.round(inicial + aportacion - retiro + rendimiento, 2)
+
+            cols["inicial"][:, m] = inicial
+            cols["aportacion"][:, m] = aportacion
+            cols["retiro"][:, m] = retiro
+            cols["rendimiento"][:, m] = rendimiento
+            cols["saldo"][:, m] = balance
+
+        centro_codes = ids // conceptos
+        concepto_codes = ids % conceptos
+        yield pd.DataFrame({
+            "Fecha": np.tile(fechas.to_numpy(), n),
+            "Centro": np.repeat([centro_name(i) for i in centro_codes], months),
+            "Concepto": np.repeat([concepto_name(j) for j in concepto_codes], months),
+            "Inicial": cols["inicial"].ravel(),
+            "Aportación": cols["aportacion"].ravel(),
+            "Retiro": cols["retiro"].ravel(),
+            "Rendimiento": cols["rendimiento"].ravel(),
+            "Saldo": cols["saldo"].ravel(),
+        })
+
+
+def synthetic_hash(centros, conceptos, months, start, seed):
+    # Stands in for the workbook hash so regenerating the same set is a dedup hit
+    key = f"synthetic:{centros}:{conceptos}:{months}:{start}:{seed}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+# ============================================================
+# WRITERS
+# ============================================================
+
+def write_xlsx(path, chunks):
+    # write_only keeps one row in memory at a time
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Capital")
+    ws.append(list(app.FACT_COLUMNS))
+    rows = 0
+    for df in chunks:
+        for row in df.itertuples(index=False):
+            ws.append([row[0].to_pydatetime(), *row[1:]])
+        rows += len(df)
+    wb.save(path)
+    return rows
+
+
+def write_database(path, chunks, file_hash, backend="sqlite", total=None):
+    storage = app.use_database(path, backend)
+    existing = storage.find_upload(file_hash)
+    if existing:
+        return app.ingest_stats(existing, 0, 0.0, duplicate=True)
+
+    columns = map(app.frame_to_columns, chunks)
+    return storage.ingest_chunks(os.path.basename(path), file_hash, columns, total)
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos de fact_capital")
+    parser.add_argument("out", help="archivo de salida (.xlsx, .db o .duckdb)")
+    parser.add_argument("--centros", type=int, default=100)
+    parser.add_argument("--conceptos", type=int, default=5, help="conceptos por centro")
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--start", default="2020-01", help="primer mes, AAAA-MM")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    total = args.centros * args.conceptos * args.months
+    chunks = generate_chunks(args.centros, args.conceptos, args.months, args.start, args.seed)
+    started = time.perf_counter()
+
+    if args.out.endswith(".xlsx"):
+        if total > XLSX_MAX_ROWS:
+            parser.error(f"{total:,} filas no caben en una hoja de Excel (máximo {XLSX_MAX_ROWS:,})")
+        rows = write_xlsx(args.out, chunks)
+    else:
+        backend = "duckdb" if args.out.endswith(".duckdb") else "sqlite"
+        file_hash = synthetic_hash(args.centros, args.conceptos, args.months, args.start, args.seed)
+        stats = write_database(args.out, chunks, file_hash, backend, total)
+        if stats["duplicate"]:
+            print(f"{args.out} ya contiene este conjunto (upload {stats['upload_id']})")
+            return
+        rows = stats["rows"]
+
+    print(f"{rows:,} filas escritas en {args.out} ({time.perf_counter() - started:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
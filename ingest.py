@@ -0,0 +1,164 @@
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime
+
+import app
+
+# ============================================================
+# BATCH INGEST (headless, for scheduled loads)
+# ============================================================
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_NO_FILES = 3
+
+
+def find_workbooks(folder, recursive=False):
+    # Sorted so re-uploaded months upsert in a predictable order
+    if recursive:
+        paths = [
+            os.path.join(root, name)
+            for root, _, names in os.walk(folder)
+            for name in names
+        ]
+    else:
+        paths = [os.path.join(folder, name) for name in os.listdir(folder)]
+    return sorted(
+        p for p in paths
+        if p.lower().endswith(".xlsx") and not os.path.basename(p).startswith("~$")
+    )
+
+
+def parse_workbook(path):
+    # Every sheet goes to the app's parse pool right away: Excel parsing is
+    # the CPU-bound part, so only parsed column chunks reach the writer
+    with open(path, "rb") as f:
+        sheets = app.workbook_sheets(f)
+        chunks = app.pooled_chunks(f, [name for name, _ in sheets])
+    return chunks, sum(rows for _, rows in sheets)
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return app.content_hash(f)
+
+
+def start_parse(path):
+    # Workbooks that can't even be opened fail when their turn to be written comes
+    try:
+        return parse_workbook(path)
+    except Exception as exc:
+        return exc
+
+
+def write_workbook(storage, path, digest, parsed, job_id):
+    # Same writer as save_upload: one transaction per workbook, rollup and
+    # filter index refreshed, data_version bumped
+    started = time.perf_counter()
+    try:
+        if isinstance(parsed, Exception):
+            raise parsed
+        chunks, total = parsed
+        stats = storage.ingest_chunks(os.path.basename(path), digest, chunks, total)
+    except Exception as exc:
+        app.update_ingest_job(
+            job_id, status="failed", error=str(exc),
+            finished=datetime.now().isoformat(), seconds=time.perf_counter() - started,
+        )
+        return {"file": path, "status": "failed", "rows": 0, "error": str(exc)}
+
+    app.update_ingest_job(
+        job_id, status="done", rows=stats["rows"], upload_id=stats["upload_id"],
+        finished=datetime.now().isoformat(), seconds=time.perf_counter() - started,
+    )
+    return {"file": path, "status": "done", "rows": stats["rows"], "seconds": stats["seconds"]}
+
+
+def ingest_folder(storage, paths, workers):
+    results = []
+    seen = {}
+    # Workbooks being parsed wait here for the writer; the window keeps only
+    # a few in memory while still letting every worker stay busy
+    pending = deque()
+    window = workers * 2
+
+    for path in paths:
+        digest = file_hash(path)
+        if digest in seen:
+            duplicate = os.path.basename(seen[digest])
+        else:
+            existing = storage.find_upload(digest)
+            duplicate = f"upload {existing}" if existing else None
+        if duplicate:
+            results.append({"file": path, "status": "skipped", "rows": 0, "duplicate_of": duplicate})
+            continue
+        seen[digest] = path
+
+        job_id = app.create_ingest_job(os.path.basename(path))
+        app.update_ingest_job(job_id, status="running", started=datetime.now().isoformat())
+        pending.append((path, digest, start_parse(path), job_id))
+        if len(pending) >= window:
+            results.append(write_workbook(storage, *pending.popleft()))
+
+    while pending:
+        results.append(write_workbook(storage, *pending.popleft()))
+
+    order = {path: i for i, path in enumerate(paths)}
+    return sorted(results, key=lambda r: order[r["file"]])
+
+
+def print_summary(results, elapsed):
+    for r in results:
+        name = os.path.basename(r["file"])
+        if r["status"] == "done":
+            print(f"  ✔ {name}: {r['rows']:,} filas en {r['seconds']:.1f} s")
+        elif r["status"] == "skipped":
+            print(f"  ↺ {name}: {app.JOB_STATUS_LABELS['skipped']} ({r['duplicate_of']})")
+        else:
+            print(f"  ✖ {name}: {r['error']}")
+
+    counts = {status: sum(r["status"] == status for r in results) for status in ["done", "skipped", "failed"]}
+    rows = sum(r["rows"] for r in results)
+    print(
+        f"{counts['done']} cargados, {counts['skipped']} omitidos, {counts['failed']} con error; "
+        f"{rows:,} filas en {elapsed:.1f} s"
+    )
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga en lote una carpeta de archivos Excel")
+    parser.add_argument("folder", help="carpeta con archivos .xlsx")
+    parser.add_argument("--recursive", action="store_true", help="incluir subcarpetas")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="procesos para leer Excel")
+    parser.add_argument("--backend", choices=sorted(app.STORAGE_BACKENDS), default=app.STORAGE_BACKEND)
+    parser.add_argument("--db", help=f"base de datos destino (por defecto {app.DB_PATH} / {app.DUCKDB_PATH})")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.folder):
+        parser.error(f"{args.folder} no es una carpeta")
+
+    paths = find_workbooks(args.folder, args.recursive)
+    if not paths:
+        print(f"No hay archivos .xlsx en {args.folder}")
+        return EXIT_NO_FILES
+
+    # ingest_jobs lives in the SQLite file for every backend, as in the app
+    storage = app.use_database(args.db, args.backend) if args.db else app.get_storage(args.backend)
+    app.ensure_db(app.DB_PATH)
+
+    app.PARSE_WORKERS = max(1, args.workers)
+    # The app leaves jobs it doesn't own alone while this run is working on them
+    app.JOB_OWNER = f"ingest:{os.getpid()}"
+    started = time.perf_counter()
+    print(f"Cargando {len(paths)} archivos de {args.folder} con {args.workers} procesos")
+    results = ingest_folder(storage, paths, app.PARSE_WORKERS)
+    counts = print_summary(results, time.perf_counter() - started)
+    return EXIT_FAILED if counts["failed"] else EXIT_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())